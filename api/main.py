@@ -4,16 +4,23 @@ Retail Data Lake API
 FastAPI endpoints for accessing Snowflake data lake
 """
 
-import sys
 import os
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import pandas as pd
+from typing import List, Literal, Optional, Dict, Any, Sequence, Tuple
 from datetime import datetime, date
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import itertools
+import re
+import threading
+import time
+import orjson
 from config.snowflake_config import get_snowflake_connection
 import logging
 
@@ -21,20 +28,28 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _orjson_default(obj):
+    # Snowflake returns NUMBER(p,s) columns as Decimal, which orjson can't encode
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class APIResponse(ORJSONResponse):
+    """orjson response that also serializes Decimal values"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
 # FastAPI app
 app = FastAPI(
     title="Retail Data Lake API",
     description="API for accessing retail analytics data from Snowflake",
-    version="1.0.0"
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    version="1.0.0",
+    default_response_class=APIResponse
 )
 
 # Pydantic models
@@ -44,7 +59,7 @@ class DataSummary(BaseModel):
     products: int
     customers: int
     countries: int
-    last_updated: str
+    last_updated: datetime
 
 class Product(BaseModel):
     stock_code: str
@@ -54,6 +69,8 @@ class Product(BaseModel):
     average_unit_price: float
     unique_customers: int
 
+CustomerSegment = Literal["VIP", "HIGH_VALUE", "MEDIUM_VALUE", "LOW_VALUE", "NEW"]
+
 class Customer(BaseModel):
     customer_id: int
     country: str
@@ -79,33 +96,173 @@ class SalesMetrics(BaseModel):
 def get_db():
     return get_snowflake_connection()
 
-# Helper function to execute SQL and return JSON
-def execute_query(sql: str) -> List[Dict[str, Any]]:
+# Blocking Snowflake calls run here so the event loop keeps serving requests
+DB_POOL = ThreadPoolExecutor(max_workers=get_db().config.pool_size)
+
+def _reset_db_pool_after_fork():
+    # Executor threads don't survive fork; give the child its own
+    global DB_POOL
+    DB_POOL = ThreadPoolExecutor(max_workers=get_db().config.pool_size)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_db_pool_after_fork)
+
+async def run_in_db_pool(func, *args):
+    """Run a blocking database call on the DB thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(DB_POOL, func, *args)
+
+def _execute_query_sync(sql: str, params: Sequence = (), prepared: bool = False) -> List[Dict[str, Any]]:
     try:
         conn = get_db()
-        result = conn.execute_sql(sql)
-        if result is not None and not result.empty:
-            records = result.to_dict('records')
-            # Convert all keys to lowercase and handle NaN values
-            clean_records = []
-            for record in records:
-                clean_record = {}
-                for k, v in record.items():
-                    key = k.lower()
-                    # Handle NaN and None values
-                    if pd.isna(v):
-                        clean_record[key] = None
-                    elif isinstance(v, float) and (v != v):  # Check for NaN
-                        clean_record[key] = None
-                    else:
-                        clean_record[key] = v
-                clean_records.append(clean_record)
-            return clean_records
-        return []
+        execute = conn.execute_prepared if prepared else conn.execute_sql_records
+        return execute(sql, params or None)
     except Exception as e:
         logger.error(f"Query execution failed: {e}")
         raise HTTPException(status_code=500, detail=f"Database query failed: {str(e)}")
 
+# Helper function to execute SQL and return JSON
+# prepared=True reuses a cached cursor per connection for frequently polled SQL
+async def execute_query(sql: str, params: Sequence = (), prepared: bool = False) -> List[Dict[str, Any]]:
+    return await run_in_db_pool(_execute_query_sync, sql, params, prepared)
+
+# Query cache for read endpoints whose data only changes once per ETL batch
+CACHE_TTL_SECONDS = 60
+CACHE_MAX_ENTRIES = 512
+BATCH_TS_TTL_SECONDS = 30
+_cache_lock = threading.RLock()
+_query_cache: Dict[Tuple[str, Tuple], Tuple[float, List[Dict[str, Any]]]] = {}
+_last_seen_batch: Optional[Tuple] = None
+_last_batch_ts: Optional[str] = None
+
+# Newest batch completion, plus whether the sales rollup has been refreshed since it.
+# The batch triggers the rollup task on its way out, so the flag flips once that run lands
+LAST_BATCH_SQL = """
+SELECT CONCAT(b.TS::VARCHAR, IFF(r.TS >= b.TS, '+rollup', '')) as last_batch_ts
+FROM (SELECT MAX(END_TIME) as TS FROM RETAIL_DATALAKE.METADATA.PIPELINE_EXECUTION_LOG) b,
+     (SELECT MAX(REFRESHED_AT) as TS FROM RETAIL_DATALAKE.ANALYTICS.SALES_DAILY_ROLLUP) r
+"""
+
+async def cached_query(sql: str, params: Sequence = (),
+                       ttl: int = CACHE_TTL_SECONDS) -> List[Dict[str, Any]]:
+    """Execute SQL through the in-process TTL cache"""
+    key = (sql, tuple(params))
+    with _cache_lock:
+        hit = _query_cache.get(key)
+        if hit and time.monotonic() - hit[0] < ttl:
+            return hit[1]
+    
+    result = await execute_query(sql, params)
+    
+    with _cache_lock:
+        _query_cache.pop(key, None)
+        _query_cache[key] = (time.monotonic(), result)
+        # Evict oldest entries first
+        while len(_query_cache) > CACHE_MAX_ENTRIES:
+            _query_cache.pop(next(iter(_query_cache)))
+    return result
+
+def invalidate_query_cache():
+    """Drop all cached query results"""
+    with _cache_lock:
+        _query_cache.clear()
+
+def note_latest_batch(batch: Dict[str, Any]):
+    """Invalidate the cache when the latest ETL batch changes status"""
+    global _last_seen_batch
+    marker = (batch.get('execution_type'), batch.get('status'), batch.get('end_time'))
+    with _cache_lock:
+        if marker != _last_seen_batch:
+            _last_seen_batch = marker
+            invalidate_query_cache()
+
+async def get_last_batch_ts() -> str:
+    """Latest data change marker; a change invalidates cached query results"""
+    global _last_batch_ts
+    result = await cached_query(LAST_BATCH_SQL, ttl=BATCH_TS_TTL_SECONDS)
+    batch_ts = str(result[0]['last_batch_ts']) if result else ""
+    with _cache_lock:
+        if batch_ts != _last_batch_ts:
+            if _last_batch_ts is not None:
+                invalidate_query_cache()
+            _last_batch_ts = batch_ts
+    return batch_ts
+
+async def cached_response(sql: str, params: Sequence = ()) -> Response:
+    """Serve a query result from the TTL cache"""
+    return APIResponse(await cached_query(sql, params))
+
+# Streaming for unbounded analytics results
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_CHUNK_ROWS = 10_000
+
+def wants_ndjson(request: Request) -> bool:
+    """Check whether the client asked for newline-delimited JSON"""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def stream_query(sql: str, params: Sequence = ()) -> StreamingResponse:
+    """Stream query rows as NDJSON, fetching one chunk at a time off the event loop"""
+    rows = get_db().execute_sql_iter(sql, params or None, chunk_size=STREAM_CHUNK_ROWS)
+    
+    def next_chunk() -> List[Dict[str, Any]]:
+        return list(itertools.islice(rows, STREAM_CHUNK_ROWS))
+    
+    async def ndjson():
+        try:
+            while True:
+                chunk = await run_in_db_pool(next_chunk)
+                if not chunk:
+                    break
+                yield b"".join(orjson.dumps(row, default=_orjson_default) + b"\n" for row in chunk)
+        finally:
+            # Releases the cursor and returns the connection to the pool
+            await run_in_db_pool(rows.close)
+    
+    return StreamingResponse(ndjson(), media_type=NDJSON_MEDIA_TYPE)
+
+# Conditional GET for batch-cadence data
+CONDITIONAL_GET_PREFIXES = (
+    "/api/analytics",
+    "/api/sales",
+    "/api/countries",
+    "/api/customers/segments",
+    "/api/products/top",
+)
+CACHE_CONTROL = f"public, max-age={CACHE_TTL_SECONDS}, stale-while-revalidate=300"
+
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    """Tag batch-cadence responses with an ETag and answer revalidations with 304"""
+    if request.method != "GET" or not request.url.path.startswith(CONDITIONAL_GET_PREFIXES):
+        return await call_next(request)
+    
+    try:
+        batch_ts = await get_last_batch_ts()
+    except HTTPException:
+        # Metadata unavailable; serve the request without validators
+        return await call_next(request)
+    
+    tag = hashlib.blake2b((batch_ts + request.headers.get("accept", "")).encode(), digest_size=16)
+    etag = f'W/"{tag.hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept"}
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+# CORS middleware (registered last so it also wraps 304 responses)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -123,30 +280,39 @@ async def root():
     }
 
 # Data summary endpoint
+# Table name -> DataSummary field; counts come from metadata, not COUNT(*) scans
+SUMMARY_TABLES = {
+    "ONLINE_RETAIL_STAGING": "staging_records",
+    "TRANSACTIONS": "transactions",
+    "PRODUCTS": "products",
+    "CUSTOMERS": "customers",
+    "COUNTRIES": "countries",
+}
+
 @app.get("/api/summary", response_model=DataSummary)
 async def get_data_summary():
     """Get overall data lake summary"""
     try:
         sql = """
         SELECT 
-            (SELECT COUNT(*) FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING) as staging_records,
-            (SELECT COUNT(*) FROM RETAIL_DATALAKE.PROCESSED_DATA.TRANSACTIONS) as transactions,
-            (SELECT COUNT(*) FROM RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS) as products,
-            (SELECT COUNT(*) FROM RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS) as customers,
-            (SELECT COUNT(*) FROM RETAIL_DATALAKE.PROCESSED_DATA.COUNTRIES) as countries,
+            TABLE_NAME as table_name,
+            ROW_COUNT as row_count,
             CURRENT_TIMESTAMP() as last_updated
+        FROM RETAIL_DATALAKE.INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA IN ('RAW_DATA', 'PROCESSED_DATA')
+        AND TABLE_NAME IN ('ONLINE_RETAIL_STAGING', 'TRANSACTIONS', 'PRODUCTS', 'CUSTOMERS', 'COUNTRIES')
         """
         
-        result = execute_query(sql)
+        result = await execute_query(sql)
         if result:
-            data = result[0]
+            counts = {SUMMARY_TABLES[row['table_name']]: int(row['row_count'] or 0) for row in result}
             return DataSummary(
-                staging_records=data['staging_records'],
-                transactions=data['transactions'],
-                products=data['products'],
-                customers=data['customers'],
-                countries=data['countries'],
-                last_updated=str(data['last_updated'])
+                staging_records=counts.get('staging_records', 0),
+                transactions=counts.get('transactions', 0),
+                products=counts.get('products', 0),
+                customers=counts.get('customers', 0),
+                countries=counts.get('countries', 0),
+                last_updated=result[0]['last_updated']
             )
         else:
             raise HTTPException(status_code=404, detail="No data found")
@@ -155,10 +321,18 @@ async def get_data_summary():
         raise HTTPException(status_code=500, detail=str(e))
 
 # Products endpoints
-@app.get("/api/products", response_model=List[Product])
+# Whitelisted sort keys map to fixed column names so the SQL text stays stable
+PRODUCT_SORT_COLUMNS = {
+    "total_revenue": "TOTAL_REVENUE",
+    "total_quantity_sold": "TOTAL_QUANTITY_SOLD",
+    "unique_customers": "UNIQUE_CUSTOMERS",
+}
+PRODUCT_SORT_RE = re.compile("^(%s)$" % "|".join(PRODUCT_SORT_COLUMNS))
+
+@app.get("/api/products", responses={200: {"model": List[Product]}})
 async def get_products(
     limit: int = Query(10, ge=1, le=100),
-    sort_by: str = Query("total_revenue", regex="^(total_revenue|total_quantity_sold|unique_customers)$")
+    sort_by: str = Query("total_revenue", pattern=PRODUCT_SORT_RE.pattern)
 ):
     """Get products with sales data"""
     sql = f"""
@@ -170,31 +344,22 @@ async def get_products(
         AVERAGE_UNIT_PRICE as average_unit_price,
         UNIQUE_CUSTOMERS as unique_customers
     FROM RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS
-    ORDER BY {sort_by.upper()} DESC
-    LIMIT {limit}
+    ORDER BY {PRODUCT_SORT_COLUMNS[sort_by]} DESC
+    LIMIT %s
     """
     
-    result = execute_query(sql)
-    return [Product(**item) for item in result]
-
-@app.get("/api/products/top")
-async def get_top_products(limit: int = Query(5, ge=1, le=20)):
-    """Get top selling products"""
-    sql = f"""
-    SELECT * FROM RETAIL_DATALAKE.ANALYTICS.TOP_PRODUCTS
-    LIMIT {limit}
-    """
-    
-    return execute_query(sql)
+    # Rows already match Product; skip per-row Pydantic validation
+    return APIResponse(await execute_query(sql, (limit,)))
 
 # Customers endpoints
-@app.get("/api/customers", response_model=List[Customer])
+@app.get("/api/customers", responses={200: {"model": List[Customer]}})
 async def get_customers(
     limit: int = Query(10, ge=1, le=100),
-    segment: Optional[str] = Query(None, regex="^(VIP|HIGH_VALUE|MEDIUM_VALUE|LOW_VALUE|NEW)$")
+    segment: Optional[CustomerSegment] = Query(None)
 ):
     """Get customers with purchase data"""
-    where_clause = f"WHERE CUSTOMER_SEGMENT = '{segment}'" if segment else ""
+    where_clause = "WHERE CUSTOMER_SEGMENT = %s" if segment else ""
+    params = (segment, limit) if segment else (limit,)
     
     sql = f"""
     SELECT 
@@ -207,45 +372,11 @@ async def get_customers(
     FROM RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS
     {where_clause}
     ORDER BY TOTAL_AMOUNT_SPENT DESC
-    LIMIT {limit}
-    """
-    
-    result = execute_query(sql)
-    return [Customer(**item) for item in result]
-
-@app.get("/api/customers/segments")
-async def get_customer_segments():
-    """Get customer segmentation breakdown"""
-    sql = """
-    SELECT 
-        CUSTOMER_SEGMENT,
-        COUNT(*) as customer_count,
-        AVG(TOTAL_AMOUNT_SPENT) as avg_spent,
-        SUM(TOTAL_AMOUNT_SPENT) as total_spent
-    FROM RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS
-    GROUP BY CUSTOMER_SEGMENT
-    ORDER BY total_spent DESC
-    """
-    
-    return execute_query(sql)
-
-# Countries endpoints
-@app.get("/api/countries", response_model=List[CountryStats])
-async def get_countries(limit: int = Query(10, ge=1, le=50)):
-    """Get country sales statistics"""
-    sql = f"""
-    SELECT 
-        COUNTRY as country,
-        TOTAL_CUSTOMERS as total_customers,
-        TOTAL_ORDERS as total_orders,
-        TOTAL_REVENUE as total_revenue
-    FROM RETAIL_DATALAKE.PROCESSED_DATA.COUNTRIES
-    ORDER BY TOTAL_REVENUE DESC
-    LIMIT {limit}
+    LIMIT %s
     """
     
-    result = execute_query(sql)
-    return [CountryStats(**item) for item in result]
+    # Rows already match Customer; skip per-row Pydantic validation
+    return APIResponse(await execute_query(sql, params))
 
 # Sales analytics endpoints
 @app.get("/api/sales/metrics", response_model=SalesMetrics)
@@ -255,23 +386,26 @@ async def get_sales_metrics(
 ):
     """Get overall sales metrics"""
     date_filter = ""
+    params = ()
     if start_date and end_date:
-        date_filter = f"WHERE INVOICE_DATE BETWEEN '{start_date}' AND '{end_date}'"
+        date_filter = "WHERE SALE_DATE BETWEEN %s AND %s"
+        params = (start_date, end_date)
         date_range = f"{start_date} to {end_date}"
     else:
         date_range = "All time"
     
+    # Aggregate the daily rollup; distinct counts are HLL estimates
     sql = f"""
     SELECT 
         SUM(TOTAL_AMOUNT) as total_sales,
-        COUNT(DISTINCT INVOICE_NO) as total_orders,
-        AVG(TOTAL_AMOUNT) as average_order_value,
-        COUNT(DISTINCT CUSTOMER_ID) as total_customers
-    FROM RETAIL_DATALAKE.PROCESSED_DATA.TRANSACTIONS
+        HLL_ESTIMATE(HLL_COMBINE(ORDERS_HLL)) as total_orders,
+        SUM(TOTAL_AMOUNT) / NULLIF(SUM(TRANSACTION_COUNT), 0) as average_order_value,
+        HLL_ESTIMATE(HLL_COMBINE(CUSTOMERS_HLL)) as total_customers
+    FROM RETAIL_DATALAKE.ANALYTICS.SALES_DAILY_ROLLUP
     {date_filter}
     """
     
-    result = execute_query(sql)
+    result = await execute_query(sql, params)
     if result:
         data = result[0]
         return SalesMetrics(
@@ -284,58 +418,95 @@ async def get_sales_metrics(
     else:
         raise HTTPException(status_code=404, detail="No sales data found")
 
-@app.get("/api/sales/daily")
-async def get_daily_sales(limit: int = Query(30, ge=1, le=365)):
-    """Get daily sales summary"""
-    sql = f"""
-    SELECT * FROM RETAIL_DATALAKE.ANALYTICS.DAILY_SALES_SUMMARY
-    ORDER BY SALE_DATE DESC
-    LIMIT {limit}
-    """
-    
-    return execute_query(sql)
-
-@app.get("/api/sales/monthly")
-async def get_monthly_revenue():
-    """Get monthly revenue trends"""
-    sql = """
-    SELECT * FROM RETAIL_DATALAKE.ANALYTICS.MONTHLY_REVENUE_TREND
-    ORDER BY YEAR DESC, MONTH DESC
-    """
-    
-    return execute_query(sql)
+# Read-only view endpoints: path -> (name, docstring, SQL template, limit bounds, response model)
+# Every route shares one handler that serves from the cache or streams NDJSON on request
+VIEW_ROUTES = {
+    "/api/products/top": (
+        "get_top_products", "Get top selling products",
+        "SELECT * FROM RETAIL_DATALAKE.ANALYTICS.TOP_PRODUCTS LIMIT %s",
+        (5, 20), None,
+    ),
+    "/api/customers/segments": (
+        "get_customer_segments", "Get customer segmentation breakdown",
+        """
+        SELECT 
+            CUSTOMER_SEGMENT,
+            COUNT(*) as customer_count,
+            AVG(TOTAL_AMOUNT_SPENT) as avg_spent,
+            SUM(TOTAL_AMOUNT_SPENT) as total_spent
+        FROM RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS
+        GROUP BY CUSTOMER_SEGMENT
+        ORDER BY total_spent DESC
+        """,
+        None, None,
+    ),
+    "/api/countries": (
+        "get_countries", "Get country sales statistics",
+        """
+        SELECT 
+            COUNTRY as country,
+            TOTAL_CUSTOMERS as total_customers,
+            TOTAL_ORDERS as total_orders,
+            TOTAL_REVENUE as total_revenue
+        FROM RETAIL_DATALAKE.PROCESSED_DATA.COUNTRIES
+        ORDER BY TOTAL_REVENUE DESC
+        LIMIT %s
+        """,
+        (10, 50), CountryStats,
+    ),
+    "/api/sales/daily": (
+        "get_daily_sales", "Get daily sales summary",
+        "SELECT * FROM RETAIL_DATALAKE.ANALYTICS.DAILY_SALES_SUMMARY ORDER BY SALE_DATE DESC LIMIT %s",
+        (30, 365), None,
+    ),
+    "/api/sales/monthly": (
+        "get_monthly_revenue", "Get monthly revenue trends",
+        "SELECT * FROM RETAIL_DATALAKE.ANALYTICS.MONTHLY_REVENUE_TREND ORDER BY YEAR DESC, MONTH DESC",
+        None, None,
+    ),
+    "/api/analytics/customer-analysis": (
+        "get_customer_analysis", "Get customer analysis data",
+        "SELECT * FROM RETAIL_DATALAKE.ANALYTICS.CUSTOMER_ANALYSIS ORDER BY TOTAL_SPENT DESC LIMIT %s",
+        (20, 100), None,
+    ),
+    "/api/analytics/sales-by-country": (
+        "get_sales_by_country", "Get sales breakdown by country",
+        "SELECT * FROM RETAIL_DATALAKE.ANALYTICS.SALES_BY_COUNTRY ORDER BY TOTAL_REVENUE DESC",
+        None, None,
+    ),
+    "/api/analytics/returns": (
+        "get_returns_analysis", "Get returns analysis",
+        "SELECT * FROM RETAIL_DATALAKE.ANALYTICS.RETURNS_ANALYSIS ORDER BY RETURN_RATE DESC",
+        None, None,
+    ),
+}
 
-# Analytics views endpoints
-@app.get("/api/analytics/customer-analysis")
-async def get_customer_analysis(limit: int = Query(20, ge=1, le=100)):
-    """Get customer analysis data"""
-    sql = f"""
-    SELECT * FROM RETAIL_DATALAKE.ANALYTICS.CUSTOMER_ANALYSIS
-    ORDER BY TOTAL_SPENT DESC
-    LIMIT {limit}
-    """
-    
-    return execute_query(sql)
+async def serve_view(request: Request, sql: str, params: Sequence = ()) -> Response:
+    """Shared handler for view routes"""
+    if wants_ndjson(request):
+        return stream_query(sql, params)
+    return await cached_response(sql, params)
 
-@app.get("/api/analytics/sales-by-country")
-async def get_sales_by_country():
-    """Get sales breakdown by country"""
-    sql = """
-    SELECT * FROM RETAIL_DATALAKE.ANALYTICS.SALES_BY_COUNTRY
-    ORDER BY TOTAL_REVENUE DESC
-    """
-    
-    return execute_query(sql)
+def make_view_endpoint(doc: str, sql: str, limit_bounds: Optional[Tuple[int, int]]):
+    """Build a view endpoint, exposing a validated `limit` query param when the SQL takes one"""
+    if limit_bounds:
+        default, upper = limit_bounds
+        async def endpoint(request: Request, limit: int = Query(default, ge=1, le=upper)):
+            return await serve_view(request, sql, (limit,))
+    else:
+        async def endpoint(request: Request):
+            return await serve_view(request, sql)
+    endpoint.__doc__ = doc
+    return endpoint
 
-@app.get("/api/analytics/returns")
-async def get_returns_analysis():
-    """Get returns analysis"""
-    sql = """
-    SELECT * FROM RETAIL_DATALAKE.ANALYTICS.RETURNS_ANALYSIS
-    ORDER BY RETURN_RATE DESC
-    """
-    
-    return execute_query(sql)
+for path, (name, doc, sql, limit_bounds, model) in VIEW_ROUTES.items():
+    app.add_api_route(
+        path,
+        make_view_endpoint(doc, sql, limit_bounds),
+        methods=["GET"],
+        name=name,
+        responses={200: {"model": List[model]}} if model else None,
+    )
 
 # Batch status endpoints
 @app.get("/api/batches/status")
@@ -355,7 +526,7 @@ async def get_batch_status():
     LIMIT 10
     """
     
-    result = execute_query(sql)
+    result = await execute_query(sql, prepared=True)
     if not result:
         # Return sample data if no batch history exists
         return [{
@@ -394,8 +565,9 @@ async def get_latest_batch():
     LIMIT 1
     """
     
-    result = execute_query(sql)
+    result = await execute_query(sql, prepared=True)
     if result:
+        note_latest_batch(result[0])
         return result[0]
     else:
         # Return a default response if no batch data exists
@@ -410,13 +582,49 @@ async def get_latest_batch():
         }
 
 # Health check
+HEALTH_QUERY = "SELECT 1 as test"
+HEALTH_FRESH_SECONDS = 10
+HEALTH_REFRESH_SECONDS = 5
+
+async def _refresh_liveness():
+    """Keep the connection liveness timestamp fresh off the request path"""
+    while True:
+        try:
+            await execute_query(HEALTH_QUERY, prepared=True)
+        except Exception as e:
+            logger.warning(f"Background health check failed: {e}")
+        await asyncio.sleep(HEALTH_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def warm_connection_pool():
+    # Pay TLS handshake + auth before traffic arrives, not on the first requests
+    try:
+        await run_in_db_pool(get_db().warm_pool)
+    except Exception as e:
+        logger.warning(f"Could not warm Snowflake connection pool: {e}")
+
+@app.on_event("startup")
+async def start_liveness_refresh():
+    app.state.liveness_task = asyncio.create_task(_refresh_liveness())
+
+@app.on_event("shutdown")
+async def stop_liveness_refresh():
+    app.state.liveness_task.cancel()
+
 @app.get("/health")
 async def health_check():
     """API health check"""
+    # Any recent successful query proves the database is reachable
+    if get_db().seconds_since_last_ok() < HEALTH_FRESH_SECONDS:
+        return {
+            "status": "healthy",
+            "database": "connected",
+            "timestamp": datetime.now().isoformat()
+        }
+    
     try:
-        conn = get_db()
-        test_result = conn.execute_sql("SELECT 1 as test")
-        if test_result is not None:
+        test_result = await execute_query(HEALTH_QUERY, prepared=True)
+        if test_result:
             return {
                 "status": "healthy",
                 "database": "connected",
@@ -438,4 +646,13 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker opens up to SNOWFLAKE_POOL_SIZE connections; keep
+    # API_WORKERS * SNOWFLAKE_POOL_SIZE within the account's connection limits
+    uvicorn.run(
+        "api.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv('API_WORKERS', os.cpu_count() or 1))
+    )
@@ -3,12 +3,22 @@ Snowflake Configuration and Connection Management
 """
 
 import os
+import math
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 import snowflake.connector
+from snowflake.connector.constants import FIELD_ID_TO_NAME
+from snowflake.connector.errors import NotSupportedError, ProgrammingError
 from snowflake.connector.pandas_tools import write_pandas
 from sqlalchemy import create_engine
 from sqlalchemy.pool import NullPool
 import pandas as pd
-from typing import Optional, Dict, Any
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Optional, Dict, Any, Callable, Iterator, List, Sequence, Tuple
 import logging
 from dotenv import load_dotenv
 
@@ -17,6 +27,61 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Connection pool tuning
+POOL_TIMEOUT_SECONDS = 30
+POOL_PRE_PING_IDLE_SECONDS = 60
+
+def _nan_to_none(value):
+    return None if value is not None and math.isnan(value) else value
+
+def _arrow_nan_to_null(column):
+    return pc.if_else(pc.is_nan(column), pa.scalar(None, column.type), column)
+
+# Per-type cleaners, resolved once per result set. Only floating columns can
+# carry NaN; every other column is passed through untouched.
+_ROW_CLEANERS = {
+    'REAL': _nan_to_none,
+}
+_ARROW_CLEANERS = [
+    (pa.types.is_floating, _arrow_nan_to_null),
+]
+
+def _make_row_converter(description) -> Callable[[Sequence], List[Dict[str, Any]]]:
+    """Build a converter from cursor rows to dicts with lowercase keys and NaN mapped to None"""
+    cols = [desc[0].lower() for desc in description]
+    cleaners = [(i, _ROW_CLEANERS[FIELD_ID_TO_NAME.get(desc[1])])
+                for i, desc in enumerate(description)
+                if FIELD_ID_TO_NAME.get(desc[1]) in _ROW_CLEANERS]
+    
+    def convert(rows) -> List[Dict[str, Any]]:
+        if not cleaners:
+            return [dict(zip(cols, row)) for row in rows]
+        records = []
+        for row in rows:
+            row = list(row)
+            for i, clean in cleaners:
+                row[i] = clean(row[i])
+            records.append(dict(zip(cols, row)))
+        return records
+    
+    return convert
+
+def _rows_to_records(description, rows) -> List[Dict[str, Any]]:
+    """Turn cursor rows into dicts with lowercase keys and NaN mapped to None"""
+    return _make_row_converter(description)(rows)
+
+def _arrow_to_records(table: pa.Table) -> List[Dict[str, Any]]:
+    """Turn an Arrow result batch into dicts with lowercase keys and NaN mapped to None"""
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        for matches, clean in _ARROW_CLEANERS:
+            if matches(field.type):
+                column = clean(column)
+                break
+        columns.append(column)
+    names = [name.lower() for name in table.schema.names]
+    return pa.Table.from_arrays(columns, names=names).to_pylist()
+
 class SnowflakeConfig:
     """Snowflake connection configuration"""
     
@@ -28,6 +93,7 @@ class SnowflakeConfig:
         self.database = os.getenv('SNOWFLAKE_DATABASE', 'RETAIL_DATALAKE')
         self.schema = os.getenv('SNOWFLAKE_SCHEMA', 'RAW_DATA')
         self.role = os.getenv('SNOWFLAKE_ROLE', 'ACCOUNTADMIN')
+        self.pool_size = int(os.getenv('SNOWFLAKE_POOL_SIZE', '4'))
     
     def get_connection_params(self) -> Dict[str, str]:
         """Get connection parameters as dictionary"""
@@ -49,25 +115,131 @@ class SnowflakeConfig:
         )
 
 class SnowflakeConnection:
-    """Snowflake connection manager"""
+    """Snowflake connection manager backed by a bounded connection pool"""
     
     def __init__(self, config: SnowflakeConfig):
         self.config = config
-        self._connection = None
+        self._pool = queue.Queue(maxsize=config.pool_size)
+        self._pool_lock = threading.Lock()
+        self._open_connections = 0
+        self._last_ok_ts = float('-inf')
+        # Per-connection {sql template: (cursor, row converter)} for execute_prepared
+        self._cursor_cache: Dict[Any, Dict[str, Tuple[Any, Callable]]] = {}
+        # Per-connection cursor reused by execute_sql/execute_dml for the life of the connection
+        self._session_cursors: Dict[Any, Any] = {}
         self._engine = None
     
-    def get_connection(self):
-        """Get native Snowflake connection"""
-        if not self._connection:
+    def _connect(self):
+        """Open a new native Snowflake connection"""
+        try:
+            conn = snowflake.connector.connect(
+                **self.config.get_connection_params()
+            )
+            logger.info("Successfully connected to Snowflake")
+            return conn
+        except Exception as e:
+            logger.error(f"Failed to connect to Snowflake: {e}")
+            raise
+    
+    def _grow(self):
+        """Open another connection if the pool has spare capacity"""
+        with self._pool_lock:
+            if self._open_connections >= self.config.pool_size:
+                return None
+            self._open_connections += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._pool_lock:
+                self._open_connections -= 1
+            raise
+    
+    def _discard(self, conn):
+        """Close a connection and free its pool slot"""
+        cursors = [cursor for cursor, _ in self._cursor_cache.pop(conn, {}).values()]
+        session_cursor = self._session_cursors.pop(conn, None)
+        if session_cursor is not None:
+            cursors.append(session_cursor)
+        for cursor in cursors:
             try:
-                self._connection = snowflake.connector.connect(
-                    **self.config.get_connection_params()
-                )
-                logger.info("Successfully connected to Snowflake")
-            except Exception as e:
-                logger.error(f"Failed to connect to Snowflake: {e}")
-                raise
-        return self._connection
+                cursor.close()
+            except Exception:
+                pass
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing Snowflake connection: {e}")
+        with self._pool_lock:
+            self._open_connections -= 1
+    
+    def _ping(self, conn) -> bool:
+        """Check that an idle connection is still usable"""
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            self._last_ok_ts = time.monotonic()
+            return True
+        except Exception as e:
+            logger.warning(f"Snowflake connection failed pre-ping: {e}")
+            return False
+    
+    def _checkout(self):
+        """Take a live connection from the pool, growing it lazily"""
+        while True:
+            try:
+                conn, last_used = self._pool.get_nowait()
+            except queue.Empty:
+                conn = self._grow()
+                if conn is not None:
+                    return conn
+                try:
+                    conn, last_used = self._pool.get(timeout=POOL_TIMEOUT_SECONDS)
+                except queue.Empty:
+                    raise TimeoutError(
+                        f"Timed out waiting {POOL_TIMEOUT_SECONDS}s for a Snowflake connection"
+                    )
+            
+            # Only pre-ping connections that have been idle for a while
+            if time.monotonic() - last_used <= POOL_PRE_PING_IDLE_SECONDS or self._ping(conn):
+                return conn
+            self._discard(conn)
+    
+    @contextmanager
+    def acquire(self):
+        """Borrow a pooled connection; it is discarded if the caller fails"""
+        conn = self._checkout()
+        healthy = True
+        try:
+            yield conn
+        except ProgrammingError:
+            # SQL errors leave the session usable
+            raise
+        except Exception:
+            healthy = False
+            raise
+        else:
+            self._last_ok_ts = time.monotonic()
+        finally:
+            if healthy:
+                self._pool.put((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+    
+    def warm_pool(self):
+        """Open connections up to the pool size ahead of the first request"""
+        while True:
+            conn = self._grow()
+            if conn is None:
+                break
+            self._pool.put((conn, time.monotonic()))
+        logger.info(f"Snowflake connection pool warmed ({self.config.pool_size} connections)")
+    
+    def seconds_since_last_ok(self) -> float:
+        """Seconds since a pooled connection last completed work without error"""
+        return time.monotonic() - self._last_ok_ts
     
     def get_engine(self):
         """Get SQLAlchemy engine"""
@@ -83,65 +255,177 @@ class SnowflakeConnection:
                 raise
         return self._engine
     
-    def execute_sql(self, sql: str) -> Optional[pd.DataFrame]:
-        """Execute SQL query and return results as DataFrame"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            
-            # If it's a SELECT query, fetch results
-            if sql.strip().upper().startswith('SELECT'):
+    def _session_cursor(self, conn):
+        """Cursor kept open for an acquired connection; the caller holds the connection exclusively"""
+        cursor = self._session_cursors.get(conn)
+        if cursor is None or cursor.is_closed():
+            cursor = self._session_cursors[conn] = conn.cursor()
+        return cursor
+    
+    def _execute(self, conn, sql: str, params: Optional[Sequence] = None) -> Optional[pd.DataFrame]:
+        """Execute SQL on an acquired connection"""
+        cursor = self._session_cursor(conn)
+        cursor.execute(sql, params)
+        
+        # If it's a SELECT query, fetch results
+        if sql.strip().upper().startswith('SELECT'):
+            try:
+                # Arrow result batches convert to pandas without per-row tuples
+                return cursor.fetch_pandas_all()
+            except NotSupportedError:
                 columns = [desc[0] for desc in cursor.description]
-                data = cursor.fetchall()
-                return pd.DataFrame(data, columns=columns)
-            else:
+                return pd.DataFrame(cursor.fetchall(), columns=columns)
+        else:
+            conn.commit()
+            logger.info(f"Successfully executed SQL: {sql[:100]}...")
+            return None
+    
+    def execute_sql(self, sql: str, params: Optional[Sequence] = None) -> Optional[pd.DataFrame]:
+        """Execute SQL query (with optional %s bind params) and return results as DataFrame"""
+        try:
+            with self.acquire() as conn:
+                return self._execute(conn, sql, params)
+        except Exception as e:
+            logger.error(f"Failed to execute SQL: {e}")
+            raise
+
+    def execute_dml(self, sql: str, params: Optional[Sequence] = None) -> int:
+        """Execute an INSERT/UPDATE/MERGE/DELETE and return the number of affected rows"""
+        try:
+            with self.acquire() as conn:
+                cursor = self._session_cursor(conn)
+                cursor.execute(sql, params)
                 conn.commit()
-                logger.info(f"Successfully executed SQL: {sql[:100]}...")
-                return None
-                
+                return cursor.rowcount or 0
         except Exception as e:
             logger.error(f"Failed to execute SQL: {e}")
             raise
-        finally:
-            if cursor:
+
+    def execute_stages(self, stages: Sequence[Sequence[str]], poll_seconds: float = 0.25):
+        """Run statement groups in order on one session; statements within a group run concurrently"""
+        try:
+            with self.acquire() as conn:
+                cursor = conn.cursor()
+                try:
+                    for stage in stages:
+                        query_ids = []
+                        for sql in stage:
+                            cursor.execute_async(sql)
+                            query_ids.append(cursor.sfqid)
+                        for query_id in query_ids:
+                            while conn.is_still_running(conn.get_query_status_throw_if_error(query_id)):
+                                time.sleep(poll_seconds)
+                    conn.commit()
+                finally:
+                    cursor.close()
+        except Exception as e:
+            logger.error(f"Failed to execute SQL stages: {e}")
+            raise
+
+    def execute_sql_records(self, sql: str, params: Optional[Sequence] = None) -> List[Dict[str, Any]]:
+        """Execute SELECT query and return rows as dicts with lowercase keys"""
+        try:
+            with self.acquire() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(sql, params)
+                    try:
+                        # Arrow batches skip per-row Python tuple materialization
+                        records = []
+                        for table in cursor.fetch_arrow_batches():
+                            records.extend(_arrow_to_records(table))
+                        return records
+                    except NotSupportedError:
+                        # Result wasn't returned in Arrow format (e.g. SHOW commands)
+                        return _rows_to_records(cursor.description, cursor.fetchall())
+                finally:
+                    cursor.close()
+
+        except Exception as e:
+            logger.error(f"Failed to execute SQL: {e}")
+            raise
+
+    def execute_prepared(self, template_sql: str, params: Optional[Sequence] = None) -> List[Dict[str, Any]]:
+        """Execute a SELECT template on a cursor reused per connection and return row dicts"""
+        try:
+            with self.acquire() as conn:
+                cursors = self._cursor_cache.setdefault(conn, {})
+                cached = cursors.get(template_sql)
+                cursor, convert = cached if cached else (conn.cursor(), None)
+                try:
+                    cursor.execute(template_sql, params)
+                except Exception:
+                    cursors.pop(template_sql, None)
+                    cursor.close()
+                    raise
+                if convert is None:
+                    convert = _make_row_converter(cursor.description)
+                    cursors[template_sql] = (cursor, convert)
+                return convert(cursor.fetchall())
+        except Exception as e:
+            logger.error(f"Failed to execute SQL: {e}")
+            raise
+
+    def execute_sql_iter(self, sql: str, params: Optional[Sequence] = None,
+                         chunk_size: int = 10_000) -> Iterator[Dict[str, Any]]:
+        """Execute SELECT query and lazily yield rows as dicts, fetching in chunks"""
+        with self.acquire() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                # Column names and cleaners are resolved once, not per chunk
+                convert = _make_row_converter(cursor.description)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield from convert(rows)
+            finally:
                 cursor.close()
-    
-    def execute_sql_file(self, file_path: str):
-        """Execute SQL commands from file"""
+
+    def execute_sql_file(self, file_path: str, sql_content: Optional[str] = None):
+        """Execute SQL commands from file (or its already-read contents)"""
         try:
-            with open(file_path, 'r') as file:
-                sql_content = file.read()
-            
-            # Split by semicolon and execute each statement
-            statements = [stmt.strip() for stmt in sql_content.split(';') if stmt.strip()]
+            if sql_content is None:
+                with open(file_path, 'r') as file:
+                    sql_content = file.read()
             
-            for stmt in statements:
-                if stmt:
-                    logger.info(f"Executing: {stmt[:50]}...")
-                    self.execute_sql(stmt)
+            # Submit the whole file as one multi-statement request (num_statements=0 allows any count);
+            # Snowflake splits it server-side, so USE DATABASE/SCHEMA carries across statements
+            with self.acquire() as conn:
+                cursor = self._session_cursor(conn)
+                cursor.execute(sql_content, num_statements=0)
+                statement_count = 1
+                while cursor.nextset():
+                    statement_count += 1
+                conn.commit()
                     
-            logger.info(f"Successfully executed SQL file: {file_path}")
+            logger.info(f"Successfully executed SQL file: {file_path} ({statement_count} statements)")
             
         except Exception as e:
             logger.error(f"Failed to execute SQL file {file_path}: {e}")
             raise
     
     def load_dataframe(self, df: pd.DataFrame, table_name: str, 
-                      if_exists: str = 'append') -> bool:
+                      if_exists: str = 'append', schema: Optional[str] = None,
+                      chunk_size: Optional[int] = None, table_type: str = '') -> bool:
         """Load pandas DataFrame to Snowflake table"""
         try:
-            conn = self.get_connection()
-            
-            success, nchunks, nrows, _ = write_pandas(
-                conn=conn,
-                df=df,
-                table_name=table_name.upper(),
-                database=self.config.database,
-                schema=self.config.schema,
-                auto_create_table=True,
-                overwrite=(if_exists == 'replace')
-            )
+            with self.acquire() as conn:
+                success, nchunks, nrows, _ = write_pandas(
+                    conn=conn,
+                    df=df,
+                    table_name=table_name.upper(),
+                    database=self.config.database,
+                    schema=schema or self.config.schema,
+                    chunk_size=chunk_size,
+                    # write_pandas stages Parquet and COPYs it in; snappy encodes much faster than gzip
+                    compression='snappy',
+                    auto_create_table=True,
+                    overwrite=(if_exists == 'replace'),
+                    table_type=table_type,
+                    use_logical_type=True
+                )
             
             if success:
                 logger.info(f"Successfully loaded {nrows} rows to {table_name}")
@@ -169,13 +453,21 @@ class SnowflakeConnection:
     
     def close(self):
         """Close connections"""
-        if self._connection:
-            self._connection.close()
-            self._connection = None
+        while True:
+            try:
+                conn, _ = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
         if self._engine:
             self._engine.dispose()
             self._engine = None
 
+@lru_cache(maxsize=1)
+def get_config() -> SnowflakeConfig:
+    """Get the process-wide Snowflake configuration, reading the environment once"""
+    return SnowflakeConfig()
+
 # Global connection instance
 _snowflake_conn = None
 
@@ -183,6 +475,13 @@ def get_snowflake_connection() -> SnowflakeConnection:
     """Get global Snowflake connection instance"""
     global _snowflake_conn
     if not _snowflake_conn:
-        config = SnowflakeConfig()
-        _snowflake_conn = SnowflakeConnection(config)
+        _snowflake_conn = SnowflakeConnection(get_config())
     return _snowflake_conn
+
+def _reset_after_fork():
+    # A forked worker must not share the parent's sockets; it builds its own pool lazily
+    global _snowflake_conn
+    _snowflake_conn = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -4,20 +4,23 @@ Retail Data Lake Dashboard
 Streamlit dashboard for visualizing retail analytics
 """
 
-import sys
-import os
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from streamlit_autorefresh import st_autorefresh
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 import json
 
 # Configuration constants
 BATCH_SIZE = 200
+TOTAL_SOURCE_ROWS = 541909  # Total rows in CSV
+ETL_STATUS_REFRESH_SECONDS = 30
+AUTO_REFRESH_SECONDS = 30
 
 # Page config
 st.set_page_config(
@@ -29,24 +32,132 @@ st.set_page_config(
 
 # API base URL
 API_BASE_URL = "http://localhost:8000"
+MAX_CONCURRENT_REQUESTS = 8
+HTTP_POOL_SIZE = 16
+
+# Cache lifetimes by endpoint prefix; anything unlisted uses DEFAULT_TTL
+STATIC_TTL = 300
+DEFAULT_TTL = 60
+VOLATILE_TTL = 10
+STATIC_ENDPOINTS = ("/api/summary", "/api/countries")
+VOLATILE_ENDPOINTS = ("/api/batches/latest", "/health")
 
 # Helper functions
-@st.cache_data(ttl=60)  # Cache for 1 minute
-def fetch_api_data(endpoint: str):
-    """Fetch data from API with caching"""
+@st.cache_resource
+def get_http_session():
+    """Shared keep-alive HTTP session"""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+    return session
+
+@st.cache_resource
+def get_fetch_pool():
+    """Worker threads for fanning requests out over the shared HTTP session"""
+    return ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+
+def _request(session: requests.Session, endpoint: str):
+    """GET an endpoint, returning (data, error message); safe to call off the script thread"""
     try:
-        response = requests.get(f"{API_BASE_URL}{endpoint}")
+        response = session.get(f"{API_BASE_URL}{endpoint}")
         if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"API Error: {response.status_code}")
-            return None
+            return response.json(), None
+        return None, f"API Error: {response.status_code}"
     except requests.exceptions.ConnectionError:
-        st.error("🔌 Cannot connect to API. Please ensure the API server is running on port 8000.")
-        return None
+        return None, "🔌 Cannot connect to API. Please ensure the API server is running on port 8000."
     except Exception as e:
-        st.error(f"Error fetching data: {e}")
-        return None
+        return None, f"Error fetching data: {e}"
+
+def _fetch(endpoint: str):
+    """Fetch data from API"""
+    data, error = _request(get_http_session(), endpoint)
+    if error:
+        st.error(error)
+    return data
+
+def _fetch_many(endpoints: tuple):
+    """Fetch several endpoints at once over the keep-alive session, returning results in the same order"""
+    session = get_http_session()
+    results = []
+    # Errors are reported here because st.error only works on the script thread
+    for data, error in get_fetch_pool().map(lambda endpoint: _request(session, endpoint), endpoints):
+        if error:
+            st.error(error)
+        results.append(data)
+    return results
+
+@st.cache_data(ttl=STATIC_TTL)
+def _fetch_static(endpoint: str):
+    return _fetch(endpoint)
+
+@st.cache_data(ttl=DEFAULT_TTL)
+def _fetch_default(endpoint: str):
+    return _fetch(endpoint)
+
+@st.cache_data(ttl=VOLATILE_TTL)
+def _fetch_volatile(endpoint: str):
+    return _fetch(endpoint)
+
+@st.cache_data(ttl=STATIC_TTL)
+def _fetch_many_static(endpoints: tuple):
+    return _fetch_many(endpoints)
+
+@st.cache_data(ttl=DEFAULT_TTL)
+def _fetch_many_default(endpoints: tuple):
+    return _fetch_many(endpoints)
+
+@st.cache_data(ttl=VOLATILE_TTL)
+def _fetch_many_volatile(endpoints: tuple):
+    return _fetch_many(endpoints)
+
+def cache_ttl(endpoint: str) -> int:
+    """TTL tier for an endpoint, matched on its path prefix"""
+    if endpoint.startswith(VOLATILE_ENDPOINTS):
+        return VOLATILE_TTL
+    if endpoint.startswith(STATIC_ENDPOINTS):
+        return STATIC_TTL
+    return DEFAULT_TTL
+
+def fetch_api_data(endpoint: str):
+    """Fetch data from API with caching"""
+    ttl = cache_ttl(endpoint)
+    if ttl == VOLATILE_TTL:
+        return _fetch_volatile(endpoint)
+    if ttl == STATIC_TTL:
+        return _fetch_static(endpoint)
+    return _fetch_default(endpoint)
+
+def fetch_api_data_many(endpoints: tuple):
+    """Fetch several endpoints concurrently, cached for the shortest TTL among them"""
+    ttl = min(cache_ttl(endpoint) for endpoint in endpoints)
+    if ttl == VOLATILE_TTL:
+        return _fetch_many_volatile(endpoints)
+    if ttl == STATIC_TTL:
+        return _fetch_many_static(endpoints)
+    return _fetch_many_default(endpoints)
+
+# Plotly figures are built once per payload and cached as plain dicts
+CHART_BUILDERS = {"line": px.line, "bar": px.bar, "pie": px.pie, "scatter": px.scatter}
+
+@st.cache_data(ttl=STATIC_TTL)
+def _build_figure(kind: str, records: list, height: int = None, **options) -> dict:
+    """Build a Plotly Express figure from API records"""
+    fig = CHART_BUILDERS[kind](pd.DataFrame(records), **options)
+    if height:
+        fig.update_layout(height=height)
+    return fig.to_dict()
+
+def plot_chart(kind: str, records: list, **options):
+    """Render a cached chart"""
+    st.plotly_chart(go.Figure(_build_figure(kind, records, **options)), use_container_width=True)
+
+@lru_cache(maxsize=128)
+def compute_batch_plan(current_records: int, batch_size: int, total: int):
+    """Progress percentage and the next batch's number and row range"""
+    progress_pct = (current_records / total) * 100
+    next_batch = (current_records // batch_size) + 1
+    next_start = current_records + 1
+    next_end = min(next_start + batch_size - 1, total)
+    return progress_pct, next_batch, next_start, next_end
 
 def format_currency(value):
     """Format value as currency"""
@@ -82,11 +193,10 @@ def main():
         ["📈 Overview", "📦 Products", "👥 Customers", "🌍 Countries", "🔄 ETL Status"]
     )
     
-    # Auto-refresh option
+    # Auto-refresh option; the timer runs in the browser so the script never blocks
     auto_refresh = st.sidebar.checkbox("🔄 Auto-refresh (30s)")
     if auto_refresh:
-        time.sleep(30)
-        st.rerun()
+        st_autorefresh(interval=AUTO_REFRESH_SECONDS * 1000, key="auto_refresh")
     
     # Manual refresh button
     if st.sidebar.button("🔄 Refresh Data"):
@@ -105,13 +215,18 @@ def main():
     elif page == "🔄 ETL Status":
         show_etl_status()
 
+@st.fragment
 def show_overview():
     """Overview dashboard page"""
     st.header("📈 Data Lake Overview")
     
-    # Get summary data
-    summary_data = fetch_api_data("/api/summary")
-    sales_metrics = fetch_api_data("/api/sales/metrics")
+    # Fetch every panel's data in one concurrent round
+    summary_data, sales_metrics, daily_sales, top_products = fetch_api_data_many((
+        "/api/summary",
+        "/api/sales/metrics",
+        "/api/sales/daily?limit=30",
+        "/api/products/top?limit=5",
+    ))
     
     if not summary_data or not sales_metrics:
         st.error("Failed to load overview data")
@@ -184,35 +299,32 @@ def show_overview():
     
     with col1:
         st.subheader("📅 Daily Sales Trend")
-        daily_sales = fetch_api_data("/api/sales/daily?limit=30")
         if daily_sales:
-            df_daily = pd.DataFrame(daily_sales)
-            fig = px.line(
-                df_daily, 
+            plot_chart(
+                "line",
+                daily_sales,
                 x='sale_date', 
                 y='total_revenue',
                 title="Daily Revenue (Last 30 Days)",
-                labels={'total_revenue': 'Revenue ($)', 'sale_date': 'Date'}
+                labels={'total_revenue': 'Revenue ($)', 'sale_date': 'Date'},
+                height=400
             )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         st.subheader("🏆 Top Products")
-        top_products = fetch_api_data("/api/products/top?limit=5")
         if top_products:
-            df_products = pd.DataFrame(top_products)
-            fig = px.bar(
-                df_products,
+            plot_chart(
+                "bar",
+                top_products,
                 x='total_revenue',
                 y='stock_code',
                 orientation='h',
                 title="Top 5 Products by Revenue",
-                labels={'total_revenue': 'Revenue ($)', 'stock_code': 'Product Code'}
+                labels={'total_revenue': 'Revenue ($)', 'stock_code': 'Product Code'},
+                height=400
             )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
 
+@st.fragment
 def show_products():
     """Products analysis page"""
     st.header("📦 Products Analysis")
@@ -236,20 +348,15 @@ def show_products():
     # Products table
     st.subheader(f"📊 Top {len(df_products)} Products")
     
-    # Format the dataframe for display
-    display_df = df_products.copy()
-    display_df['total_revenue'] = display_df['total_revenue'].apply(lambda x: f"${x:,.2f}")
-    display_df['average_unit_price'] = display_df['average_unit_price'].apply(lambda x: f"${x:.2f}")
-    display_df['total_quantity_sold'] = display_df['total_quantity_sold'].apply(lambda x: f"{x:,}")
-    
+    # Currency and count formatting is applied by the frontend via column_config
     st.dataframe(
-        display_df,
+        df_products,
         column_config={
             "stock_code": "Product Code",
             "description": "Description",
-            "total_quantity_sold": "Qty Sold",
-            "total_revenue": "Revenue",
-            "average_unit_price": "Avg Price",
+            "total_quantity_sold": st.column_config.NumberColumn("Qty Sold", format="%d"),
+            "total_revenue": st.column_config.NumberColumn("Revenue", format="$%.2f"),
+            "average_unit_price": st.column_config.NumberColumn("Avg Price", format="$%.2f"),
             "unique_customers": "Customers"
         },
         use_container_width=True
@@ -260,54 +367,32 @@ def show_products():
     
     with col1:
         st.subheader("💰 Revenue Distribution")
-        fig = px.pie(
-            df_products.head(10),
+        plot_chart(
+            "pie",
+            products_data[:10],
             values='total_revenue',
             names='stock_code',
             title="Revenue by Product (Top 10)"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         st.subheader("📊 Quantity vs Revenue")
-        fig = px.scatter(
-            df_products,
+        plot_chart(
+            "scatter",
+            products_data,
             x='total_quantity_sold',
             y='total_revenue',
             hover_data=['stock_code', 'description'],
             title="Quantity Sold vs Revenue"
         )
-        st.plotly_chart(fig, use_container_width=True)
 
+@st.fragment
 def show_customers():
     """Customers analysis page"""
     st.header("👥 Customer Analysis")
     
-    # Customer segments
-    segments_data = fetch_api_data("/api/customers/segments")
-    if segments_data:
-        st.subheader("🎯 Customer Segments")
-        df_segments = pd.DataFrame(segments_data)
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            fig = px.pie(
-                df_segments,
-                values='customer_count',
-                names='customer_segment',
-                title="Customer Count by Segment"
-            )
-            st.plotly_chart(fig, use_container_width=True)
-        
-        with col2:
-            fig = px.bar(
-                df_segments,
-                x='customer_segment',
-                y='total_spent',
-                title="Total Spending by Segment"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+    # Segments render above the filters but are fetched together with the customer list
+    segments_container = st.container()
     
     # Customer details
     col1, col2 = st.columns(2)
@@ -324,29 +409,52 @@ def show_customers():
     if segment_filter != "All":
         endpoint += f"&segment={segment_filter}"
     
-    customers_data = fetch_api_data(endpoint)
+    segments_data, customers_data = fetch_api_data_many(("/api/customers/segments", endpoint))
+    
+    # Customer segments
+    if segments_data:
+        with segments_container:
+            st.subheader("🎯 Customer Segments")
+            
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                plot_chart(
+                    "pie",
+                    segments_data,
+                    values='customer_count',
+                    names='customer_segment',
+                    title="Customer Count by Segment"
+                )
+            
+            with col2:
+                plot_chart(
+                    "bar",
+                    segments_data,
+                    x='customer_segment',
+                    y='total_spent',
+                    title="Total Spending by Segment"
+                )
     
     if customers_data:
         df_customers = pd.DataFrame(customers_data)
         
-        # Format for display
-        display_df = df_customers.copy()
-        display_df['total_amount_spent'] = display_df['total_amount_spent'].apply(lambda x: f"${x:,.2f}")
-        
+        # Formatting is applied by the frontend via column_config
         st.subheader(f"👥 Customer Details ({segment_filter})")
         st.dataframe(
-            display_df,
+            df_customers,
             column_config={
                 "customer_id": "Customer ID",
                 "country": "Country",
                 "total_orders": "Orders",
-                "total_amount_spent": "Total Spent",
+                "total_amount_spent": st.column_config.NumberColumn("Total Spent", format="$%.2f"),
                 "customer_segment": "Segment",
                 "days_since_last_purchase": "Days Since Last Purchase"
             },
             use_container_width=True
         )
 
+@st.fragment
 def show_countries():
     """Countries analysis page"""
     st.header("🌍 Geographic Analysis")
@@ -360,6 +468,11 @@ def show_countries():
     
     df_countries = pd.DataFrame(countries_data)
     
+    # Top country by revenue in a single positional pass
+    revenue = df_countries['total_revenue'].to_numpy()
+    top_index = revenue.argmax()
+    top_revenue, top_country = revenue[top_index], df_countries['country'].iat[top_index]
+    
     # Key metrics
     col1, col2, col3 = st.columns(3)
     
@@ -373,12 +486,11 @@ def show_countries():
     with col2:
         st.metric(
             "💰 Top Country Revenue",
-            format_currency(df_countries['total_revenue'].max()),
+            format_currency(top_revenue),
             help="Highest revenue country"
         )
     
     with col3:
-        top_country = df_countries.loc[df_countries['total_revenue'].idxmax(), 'country']
         st.metric(
             "🏆 Top Country",
             top_country,
@@ -390,48 +502,47 @@ def show_countries():
     
     with col1:
         st.subheader("💰 Revenue by Country")
-        fig = px.bar(
-            df_countries.head(10),
+        plot_chart(
+            "bar",
+            countries_data[:10],
             x='total_revenue',
             y='country',
             orientation='h',
             title="Top 10 Countries by Revenue"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         st.subheader("👥 Customers by Country")
-        fig = px.bar(
-            df_countries.head(10),
+        plot_chart(
+            "bar",
+            countries_data[:10],
             x='total_customers',
             y='country',
             orientation='h',
             title="Top 10 Countries by Customer Count"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     # Countries table
     st.subheader("🌍 All Countries")
-    display_df = df_countries.copy()
-    display_df['total_revenue'] = display_df['total_revenue'].apply(lambda x: f"${x:,.2f}")
-    
     st.dataframe(
-        display_df,
+        df_countries,
         column_config={
             "country": "Country",
             "total_customers": "Customers",
             "total_orders": "Orders",
-            "total_revenue": "Revenue"
+            "total_revenue": st.column_config.NumberColumn("Revenue", format="$%.2f")
         },
         use_container_width=True
     )
 
+@st.fragment(run_every=ETL_STATUS_REFRESH_SECONDS)
 def show_etl_status():
     """ETL pipeline status page"""
     st.header("🔄 ETL Pipeline Status")
     
+    summary_data, latest_batch = fetch_api_data_many(("/api/summary", "/api/batches/latest"))
+    
     # Show current data lake status instead of batch info
-    summary_data = fetch_api_data("/api/summary")
     if summary_data:
         st.subheader("📊 Current Data Lake Status")
         
@@ -469,18 +580,13 @@ def show_etl_status():
     st.subheader("🔄 ETL Progress")
     
     # Calculate progress
-    total_possible = 541909  # Total rows in CSV
     current_records = summary_data['staging_records'] if summary_data else 0
-    progress_pct = (current_records / total_possible) * 100
+    progress_pct, next_batch, next_start, next_end = compute_batch_plan(current_records, BATCH_SIZE, TOTAL_SOURCE_ROWS)
     
     st.progress(progress_pct / 100)
-    st.write(f"**Progress**: {current_records:,} / {total_possible:,} records ({progress_pct:.1f}%)")
+    st.write(f"**Progress**: {current_records:,} / {TOTAL_SOURCE_ROWS:,} records ({progress_pct:.1f}%)")
     
     # Next batch info
-    next_batch = (current_records // BATCH_SIZE) + 1
-    next_start = current_records + 1
-    next_end = min(next_start + BATCH_SIZE - 1, total_possible)
-    
     st.info(f"**Next Batch**: Batch {next_batch} (rows {next_start:,} - {next_end:,})")
     
     # Manual ETL controls
@@ -497,7 +603,6 @@ def show_etl_status():
             st.info("To check status, run: `python3 etl/incremental_etl_pipeline.py --status`")
     
     # Latest batch info (if available)
-    latest_batch = fetch_api_data("/api/batches/latest")
     if latest_batch and latest_batch.get('execution_type') != 'No batches yet':
         st.subheader("📊 Latest Batch")
         
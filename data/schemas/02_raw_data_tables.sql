@@ -12,7 +12,7 @@ CREATE OR REPLACE TABLE ONLINE_RETAIL_STAGING (
     -- Original data fields
     INVOICE_NO VARCHAR(50) NOT NULL,
     STOCK_CODE VARCHAR(50) NOT NULL,
-    DESCRIPTION VARCHAR(500),
+    DESCRIPTION VARCHAR(500), -- set once per distinct (STOCK_CODE, DESCRIPTION) in a batch
     QUANTITY INTEGER NOT NULL,
     INVOICE_DATE TIMESTAMP_NTZ NOT NULL,
     UNIT_PRICE DECIMAL(10,2) NOT NULL,
@@ -28,7 +28,10 @@ CREATE OR REPLACE TABLE ONLINE_RETAIL_STAGING (
     -- Data quality flags
     HAS_MISSING_CUSTOMER_ID BOOLEAN,
     IS_RETURN BOOLEAN,
-    TOTAL_AMOUNT DECIMAL(12,2)
+    TOTAL_AMOUNT DECIMAL(12,2),
+    
+    -- HASH(INVOICE_NO, STOCK_CODE, ROW_NUMBER_IN_FILE), used for deduplication
+    TRANSACTION_HASH NUMBER(19)
 )
 COMMENT = 'Staging table for raw online retail transaction data';
 
@@ -71,5 +74,6 @@ COMMENT = 'Log of file processing activities and statistics';
 -- INDEXES FOR PERFORMANCE
 -- =====================================================
 
--- Create clustering key on staging table for better performance
-ALTER TABLE ONLINE_RETAIL_STAGING CLUSTER BY (INVOICE_DATE, COUNTRY);
+-- Cluster staging by batch first so per-batch DATA_SOURCE filters prune micro-partitions,
+-- then by natural key; dedup joins on TRANSACTION_HASH, which has no locality to cluster on
+ALTER TABLE ONLINE_RETAIL_STAGING CLUSTER BY (DATA_SOURCE, INVOICE_NO, STOCK_CODE);
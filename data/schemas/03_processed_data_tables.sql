@@ -17,8 +17,11 @@ CREATE OR REPLACE TABLE TRANSACTIONS (
     STOCK_CODE VARCHAR(50) NOT NULL,
     CUSTOMER_ID INTEGER,
     
-    -- Transaction details
-    DESCRIPTION VARCHAR(500),
+    -- Integer surrogates of INVOICE_NO/STOCK_CODE for joins (INVOICES.INVOICE_NO_ID, PRODUCTS.STOCK_CODE_ID)
+    INVOICE_NO_ID INTEGER,
+    STOCK_CODE_ID INTEGER,
+    
+    -- Transaction details (DESCRIPTION lives in PRODUCTS; join on STOCK_CODE)
     QUANTITY INTEGER NOT NULL,
     UNIT_PRICE DECIMAL(10,2) NOT NULL,
     TOTAL_AMOUNT DECIMAL(12,2) NOT NULL,
@@ -51,6 +54,7 @@ COMMENT = 'Clean transaction data with business rules applied';
 
 CREATE OR REPLACE TABLE PRODUCTS (
     STOCK_CODE VARCHAR(50) PRIMARY KEY,
+    STOCK_CODE_ID INTEGER AUTOINCREMENT UNIQUE,
     DESCRIPTION VARCHAR(500),
     
     -- Aggregated metrics
@@ -60,12 +64,17 @@ CREATE OR REPLACE TABLE PRODUCTS (
     MIN_UNIT_PRICE DECIMAL(10,2),
     MAX_UNIT_PRICE DECIMAL(10,2),
     
+    -- Running sum/count of sale unit prices; AVERAGE_UNIT_PRICE = SUM / COUNT
+    UNIT_PRICE_SUM DECIMAL(18,2) DEFAULT 0,
+    UNIT_PRICE_COUNT INTEGER DEFAULT 0,
+    
     -- Date tracking
     FIRST_SALE_DATE TIMESTAMP_NTZ,
     LAST_SALE_DATE TIMESTAMP_NTZ,
     
-    -- Customer metrics
+    -- Customer metrics; UNIQUE_CUSTOMERS = HLL_ESTIMATE(UNIQUE_CUSTOMERS_SKETCH)
     UNIQUE_CUSTOMERS INTEGER DEFAULT 0,
+    UNIQUE_CUSTOMERS_SKETCH BINARY,
     
     -- Product categorization (can be enhanced later)
     PRODUCT_CATEGORY VARCHAR(100),
@@ -92,6 +101,12 @@ CREATE OR REPLACE TABLE CUSTOMERS (
     TOTAL_AMOUNT_SPENT DECIMAL(15,2) DEFAULT 0,
     AVERAGE_ORDER_VALUE DECIMAL(10,2),
     
+    -- Sale lines behind TOTAL_AMOUNT_SPENT; AVERAGE_ORDER_VALUE = TOTAL_AMOUNT_SPENT / SALE_LINE_COUNT
+    SALE_LINE_COUNT INTEGER DEFAULT 0,
+    
+    -- HLL state of distinct invoices; TOTAL_ORDERS = HLL_ESTIMATE(ORDERS_SKETCH)
+    ORDERS_SKETCH BINARY,
+    
     -- Customer segmentation
     CUSTOMER_SEGMENT VARCHAR(50),
     
@@ -118,6 +133,10 @@ CREATE OR REPLACE TABLE COUNTRIES (
     TOTAL_ORDERS INTEGER DEFAULT 0,
     TOTAL_REVENUE DECIMAL(15,2) DEFAULT 0,
     
+    -- HLL states behind TOTAL_CUSTOMERS and TOTAL_ORDERS, mergeable across batches
+    CUSTOMERS_SKETCH BINARY,
+    ORDERS_SKETCH BINARY,
+    
     -- Date tracking
     FIRST_ORDER_DATE TIMESTAMP_NTZ,
     LAST_ORDER_DATE TIMESTAMP_NTZ,
@@ -128,9 +147,26 @@ CREATE OR REPLACE TABLE COUNTRIES (
 )
 COMMENT = 'Country reference data with aggregated sales metrics';
 
+-- =====================================================
+-- INVOICE KEYS TABLE
+-- =====================================================
+
+CREATE OR REPLACE TABLE INVOICES (
+    INVOICE_NO_ID INTEGER AUTOINCREMENT PRIMARY KEY,
+    INVOICE_NO VARCHAR(50) NOT NULL UNIQUE,
+    CREATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+)
+COMMENT = 'Integer surrogate keys for invoice numbers';
+
 -- =====================================================
 -- CLUSTERING AND INDEXING
 -- =====================================================
 
 -- Cluster transactions by date and country for better performance
 ALTER TABLE TRANSACTIONS CLUSTER BY (INVOICE_DATE, COUNTRY);
+
+-- Cluster dimensions by their MERGE keys so the per-batch join probe prunes micro-partitions.
+-- Check with: SELECT SYSTEM$CLUSTERING_INFORMATION('PRODUCTS', '(STOCK_CODE)');
+ALTER TABLE PRODUCTS CLUSTER BY (STOCK_CODE);
+ALTER TABLE CUSTOMERS CLUSTER BY (CUSTOMER_ID);
+ALTER TABLE COUNTRIES CLUSTER BY (COUNTRY);
@@ -4,6 +4,9 @@
 
 USE SCHEMA RETAIL_DATALAKE.ANALYTICS;
 
+-- Distinct-order counts and product joins use the integer INVOICE_NO_ID /
+-- STOCK_CODE_ID surrogates assigned during the fact load
+
 -- =====================================================
 -- SALES BY COUNTRY VIEW
 -- =====================================================
@@ -11,7 +14,7 @@ USE SCHEMA RETAIL_DATALAKE.ANALYTICS;
 CREATE OR REPLACE VIEW SALES_BY_COUNTRY AS
 SELECT 
     t.COUNTRY,
-    COUNT(DISTINCT t.INVOICE_NO) AS TOTAL_ORDERS,
+    COUNT(DISTINCT t.INVOICE_NO_ID) AS TOTAL_ORDERS,
     COUNT(DISTINCT t.CUSTOMER_ID) AS UNIQUE_CUSTOMERS,
     SUM(t.TOTAL_AMOUNT) AS TOTAL_REVENUE,
     AVG(t.TOTAL_AMOUNT) AS AVERAGE_ORDER_VALUE,
@@ -41,7 +44,7 @@ CREATE OR REPLACE VIEW MONTHLY_REVENUE_TREND AS
 SELECT 
     DATE_TRUNC('month', t.INVOICE_DATE) AS MONTH,
     t.COUNTRY,
-    COUNT(DISTINCT t.INVOICE_NO) AS ORDERS,
+    COUNT(DISTINCT t.INVOICE_NO_ID) AS ORDERS,
     COUNT(DISTINCT t.CUSTOMER_ID) AS CUSTOMERS,
     SUM(t.TOTAL_AMOUNT) AS REVENUE,
     AVG(t.TOTAL_AMOUNT) AS AVG_ORDER_VALUE,
@@ -144,7 +147,7 @@ CREATE OR REPLACE VIEW DAILY_SALES_SUMMARY AS
 SELECT 
     DATE(t.INVOICE_DATE) AS SALE_DATE,
     DAYNAME(t.INVOICE_DATE) AS DAY_OF_WEEK,
-    COUNT(DISTINCT t.INVOICE_NO) AS TOTAL_ORDERS,
+    COUNT(DISTINCT t.INVOICE_NO_ID) AS TOTAL_ORDERS,
     COUNT(DISTINCT t.CUSTOMER_ID) AS UNIQUE_CUSTOMERS,
     COUNT(*) AS TOTAL_TRANSACTIONS,
     SUM(t.TOTAL_AMOUNT) AS TOTAL_REVENUE,
@@ -176,8 +179,8 @@ ORDER BY SALE_DATE DESC;
 CREATE OR REPLACE VIEW RETURNS_ANALYSIS AS
 SELECT 
     t.COUNTRY,
-    t.STOCK_CODE,
-    p.DESCRIPTION,
+    ANY_VALUE(p.STOCK_CODE) AS STOCK_CODE,
+    ANY_VALUE(p.DESCRIPTION) AS DESCRIPTION,
     COUNT(*) AS RETURN_TRANSACTIONS,
     SUM(ABS(t.QUANTITY)) AS TOTAL_RETURNED_QUANTITY,
     SUM(ABS(t.TOTAL_AMOUNT)) AS TOTAL_RETURN_VALUE,
@@ -190,7 +193,7 @@ SELECT
     DATE(MAX(t.INVOICE_DATE)) AS LAST_RETURN_DATE
     
 FROM RETAIL_DATALAKE.PROCESSED_DATA.TRANSACTIONS t
-JOIN RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS p ON t.STOCK_CODE = p.STOCK_CODE
+JOIN RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS p ON t.STOCK_CODE_ID = p.STOCK_CODE_ID
 WHERE t.TRANSACTION_TYPE = 'RETURN'
-GROUP BY t.COUNTRY, t.STOCK_CODE, p.DESCRIPTION
+GROUP BY t.COUNTRY, t.STOCK_CODE_ID
 ORDER BY TOTAL_RETURN_VALUE DESC;
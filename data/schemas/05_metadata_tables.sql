@@ -3,6 +3,8 @@
 -- =====================================================
 
 USE SCHEMA RETAIL_DATALAKE.METADATA;
+-- Each schema file runs on its own pooled session, so select compute here too
+USE WAREHOUSE RETAIL_WH;
 
 -- =====================================================
 -- DATA CATALOG TABLE
@@ -90,7 +92,7 @@ COMMENT = 'Data lineage tracking source-to-target relationships';
 -- =====================================================
 
 CREATE OR REPLACE TABLE PIPELINE_EXECUTION_LOG (
-    EXECUTION_ID INTEGER AUTOINCREMENT PRIMARY KEY,
+    EXECUTION_ID VARCHAR(36) DEFAULT UUID_STRING() PRIMARY KEY, -- callers may supply their own UUID
     
     -- Pipeline identification
     PIPELINE_NAME VARCHAR(200) NOT NULL,
@@ -0,0 +1,42 @@
+-- =====================================================
+-- ANALYTICS SCHEMA ROLLUPS
+-- =====================================================
+
+USE SCHEMA RETAIL_DATALAKE.ANALYTICS;
+
+-- =====================================================
+-- DAILY SALES ROLLUP TABLE
+-- =====================================================
+
+-- Distinct orders/customers are kept as HyperLogLog states so any date range
+-- can be estimated with HLL_COMBINE instead of COUNT(DISTINCT) over TRANSACTIONS
+CREATE OR REPLACE TABLE SALES_DAILY_ROLLUP (
+    SALE_DATE DATE PRIMARY KEY,
+    TOTAL_AMOUNT DECIMAL(15,2),
+    TRANSACTION_COUNT INTEGER,
+    ORDERS_HLL BINARY,
+    CUSTOMERS_HLL BINARY,
+    REFRESHED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+)
+COMMENT = 'Daily sales totals with HLL sketches of orders and customers';
+
+-- =====================================================
+-- ROLLUP REFRESH TASK
+-- =====================================================
+
+-- No schedule: the incremental pipeline runs EXECUTE TASK after each loaded batch,
+-- which works on a suspended task, so the warehouse only wakes when data changed
+CREATE OR REPLACE TASK REFRESH_SALES_DAILY_ROLLUP
+    WAREHOUSE = RETAIL_WH
+    COMMENT = 'Rebuilds SALES_DAILY_ROLLUP from the transactions fact table; run on demand after each batch'
+AS
+INSERT OVERWRITE INTO SALES_DAILY_ROLLUP
+    (SALE_DATE, TOTAL_AMOUNT, TRANSACTION_COUNT, ORDERS_HLL, CUSTOMERS_HLL)
+SELECT
+    DATE(t.INVOICE_DATE) AS SALE_DATE,
+    SUM(t.TOTAL_AMOUNT) AS TOTAL_AMOUNT,
+    COUNT(*) AS TRANSACTION_COUNT,
+    HLL_ACCUMULATE(t.INVOICE_NO_ID) AS ORDERS_HLL,
+    HLL_ACCUMULATE(t.CUSTOMER_ID) AS CUSTOMERS_HLL
+FROM RETAIL_DATALAKE.PROCESSED_DATA.TRANSACTIONS t
+GROUP BY DATE(t.INVOICE_DATE);
@@ -5,11 +5,11 @@ Loads retail data in batches with deduplication and incremental updates
 """
 
 import sys
-import os
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pcsv
 from datetime import datetime
 import logging
 import argparse
@@ -23,63 +23,158 @@ logger = logging.getLogger(__name__)
 
 # Configuration constants
 BATCH_SIZE = 200
+LOAD_CHUNK_ROWS = 16000
+
+# Source CSV and its column types, so the parser skips type inference
+CSV_FILE = "/Users/tuandang/personal/research/AI/datalake-demo/data/processed/online_retail.csv"
+CSV_BLOCK_BYTES = 1 << 20
+CSV_COLUMN_TYPES = {
+    'InvoiceNo': pa.string(),
+    'StockCode': pa.string(),
+    'Description': pa.string(),
+    'Quantity': pa.int32(),
+    'InvoiceDate': pa.timestamp('s'),
+    'UnitPrice': pa.float64(),
+    # Older exports write IDs as '15012.0', so parse as float and cast to Int64 after conversion
+    'CustomerID': pa.float64(),
+    'Country': pa.dictionary(pa.int32(), pa.string()),
+}
+
+# Nullable pandas dtypes for the Arrow -> pandas conversion (dictionaries become categories)
+PANDAS_TYPES = {
+    pa.string(): pd.StringDtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+}
+
+# Staging table columns in DDL order
+STAGING_COLUMNS = [
+    'INVOICE_NO', 'STOCK_CODE', 'DESCRIPTION', 'QUANTITY', 'INVOICE_DATE', 'UNIT_PRICE',
+    'CUSTOMER_ID', 'COUNTRY', 'LOAD_TIMESTAMP', 'FILE_NAME', 'ROW_NUMBER_IN_FILE',
+    'DATA_SOURCE', 'HAS_MISSING_CUSTOMER_ID', 'IS_RETURN', 'TOTAL_AMOUNT'
+]
+
+# Table name -> get_data_summary key
+SUMMARY_TABLES = {
+    'ONLINE_RETAIL_STAGING': 'staging',
+    'TRANSACTIONS': 'transactions',
+    'PRODUCTS': 'products',
+    'CUSTOMERS': 'customers',
+    'COUNTRIES': 'countries',
+}
+
+# Staging row fingerprint; TRANSACTION_HASH is computed server-side on insert
+TRANSACTION_HASH_SQL = "HASH(INVOICE_NO, STOCK_CODE, ROW_NUMBER_IN_FILE)"
 
 class IncrementalETLPipeline:
     def __init__(self):
         self.conn = get_snowflake_connection()
         self.batch_size = BATCH_SIZE
+        # Streaming CSV reader kept across batches; reopened when the file changes or we jump batches
+        self._reader = None
+        self._reader_mtime = None
+        self._reader_batch = 0
+        self._pending = []
+        # Last staged ROW_NUMBER_IN_FILE, cached after the first lookup and advanced locally on load
+        self._last_row = None
+        # PIPELINE_EXECUTION_LOG row of the batch in progress
+        self._execution_id = None
+        # Rows with a customer and a positive quantity in the last staged batch (feeds the CUSTOMERS MERGE)
+        self._customer_sale_rows = None
+    
+    def read_batch(self, batch_number: int) -> pd.DataFrame:
+        """Read one batch of the CSV with pyarrow's CSV parser, reusing the open stream for sequential batches"""
+        mtime = Path(CSV_FILE).stat().st_mtime
+        if self._reader is None or mtime != self._reader_mtime or batch_number != self._reader_batch + 1:
+            if self._reader is not None:
+                self._reader.close()
+            self._reader = pcsv.open_csv(
+                CSV_FILE,
+                read_options=pcsv.ReadOptions(
+                    block_size=CSV_BLOCK_BYTES,
+                    skip_rows_after_names=(batch_number - 1) * self.batch_size
+                ),
+                convert_options=pcsv.ConvertOptions(
+                    column_types=CSV_COLUMN_TYPES,
+                    include_columns=list(CSV_COLUMN_TYPES),
+                    strings_can_be_null=True
+                )
+            )
+            self._reader_mtime = mtime
+            self._pending = []
+        
+        # Blocks don't align with batches, so carry any rows past this batch over to the next call
+        batches = self._pending
+        rows = sum(len(batch) for batch in batches)
+        while rows < self.batch_size:
+            try:
+                batch = self._reader.read_next_batch()
+            except StopIteration:
+                break
+            batches.append(batch)
+            rows += len(batch)
+        
+        table = pa.Table.from_batches(batches, schema=self._reader.schema)
+        self._pending = table.slice(self.batch_size).to_batches()
+        self._reader_batch = batch_number
+        
+        if table.num_rows == 0:
+            return pd.DataFrame()
+        df = table.slice(0, self.batch_size).to_pandas(types_mapper=PANDAS_TYPES.get)
+        df['CustomerID'] = df['CustomerID'].astype(pd.Int64Dtype())
+        return df
         
     def get_last_processed_row(self) -> int:
         """Get the last row number that was processed"""
+        if self._last_row is not None:
+            return self._last_row
         try:
             result = self.conn.execute_sql(
                 "SELECT MAX(ROW_NUMBER_IN_FILE) FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING"
             )
             if result is not None and not result.empty:
                 last_row = result.iloc[0, 0]
-                return int(last_row) if last_row is not None else 0
+                self._last_row = int(last_row) if pd.notna(last_row) else 0
+                return self._last_row
             return 0
         except Exception as e:
             logger.warning(f"Could not get last processed row: {e}")
             return 0
     
     def log_batch_start(self, batch_number: int, start_row: int, end_row: int):
-        """Log batch processing start"""
+        """Log batch processing start, remembering the execution id for log_batch_end"""
         try:
-            sql = f"""
+            execution_id = str(uuid.uuid4())
+            sql = """
             INSERT INTO RETAIL_DATALAKE.METADATA.PIPELINE_EXECUTION_LOG 
-            (PIPELINE_NAME, PIPELINE_VERSION, EXECUTION_TYPE, STATUS, EXECUTED_BY, 
+            (EXECUTION_ID, PIPELINE_NAME, PIPELINE_VERSION, EXECUTION_TYPE, STATUS, EXECUTED_BY, 
              ROWS_PROCESSED, EXECUTION_CONTEXT)
-            VALUES ('INCREMENTAL_ETL', '1.0', 'BATCH_{batch_number}', 'RUNNING', 'ETL_PIPELINE',
-                    {end_row - start_row + 1}, 
-                    PARSE_JSON('{{"batch_number": {batch_number}, "start_row": {start_row}, "end_row": {end_row}}}'))
+            SELECT %s, 'INCREMENTAL_ETL', '1.0', %s, 'RUNNING', 'ETL_PIPELINE', %s,
+                   OBJECT_CONSTRUCT('batch_number', %s::INT, 'start_row', %s::INT, 'end_row', %s::INT)
             """
-            self.conn.execute_sql(sql)
+            self.conn.execute_sql(sql, (execution_id, f'BATCH_{batch_number}', end_row - start_row + 1,
+                                        batch_number, start_row, end_row))
+            self._execution_id = execution_id
             logger.info(f"✅ Logged batch {batch_number} start")
         except Exception as e:
             logger.warning(f"Could not log batch start: {e}")
     
     def log_batch_end(self, batch_number: int, status: str, rows_loaded: int, error_msg: str = None):
-        """Log batch processing end"""
+        """Log batch processing end against the execution started by log_batch_start"""
+        if self._execution_id is None:
+            logger.warning(f"No logged start for batch {batch_number}; skipping end log")
+            return
         try:
-            error_clause = f", ERROR_MESSAGE = '{error_msg}'" if error_msg else ""
-            
-            sql = f"""
+            sql = """
             UPDATE RETAIL_DATALAKE.METADATA.PIPELINE_EXECUTION_LOG 
             SET END_TIME = CURRENT_TIMESTAMP(),
-                STATUS = '{status}',
-                ROWS_INSERTED = {rows_loaded}
-                {error_clause}
-            WHERE PIPELINE_NAME = 'INCREMENTAL_ETL' 
-            AND STATUS = 'RUNNING'
-            AND EXECUTION_TYPE = 'BATCH_{batch_number}'
-            AND START_TIME = (
-                SELECT MAX(START_TIME) 
-                FROM RETAIL_DATALAKE.METADATA.PIPELINE_EXECUTION_LOG 
-                WHERE PIPELINE_NAME = 'INCREMENTAL_ETL' AND EXECUTION_TYPE = 'BATCH_{batch_number}'
-            )
+                STATUS = %s,
+                ROWS_INSERTED = %s,
+                ERROR_MESSAGE = COALESCE(%s, ERROR_MESSAGE)
+            WHERE EXECUTION_ID = %s
             """
-            self.conn.execute_sql(sql)
+            self.conn.execute_sql(sql, (status, rows_loaded, error_msg, self._execution_id))
+            self._execution_id = None
             logger.info(f"✅ Logged batch {batch_number} completion")
         except Exception as e:
             logger.warning(f"Could not log batch end: {e}")
@@ -89,11 +184,8 @@ class IncrementalETLPipeline:
         logger.info(f"Loading batch {batch_number}: rows {start_row}-{end_row}")
         
         try:
-            # Read CSV file
-            csv_file = "/Users/tuandang/personal/research/AI/datalake-demo/data/processed/online_retail.csv"
-            
             # Read only the specific batch
-            df = pd.read_csv(csv_file, skiprows=range(1, start_row), nrows=end_row - start_row + 1)
+            df = self.read_batch(batch_number)
             logger.info(f"Read {len(df):,} rows from CSV for batch {batch_number}")
             
             if df.empty:
@@ -113,98 +205,74 @@ class IncrementalETLPipeline:
             }
             df = df.rename(columns=column_mapping)
             
-            # Data cleaning
-            df['INVOICE_DATE'] = pd.to_datetime(df['INVOICE_DATE'])
-            df['UNIT_PRICE'] = pd.to_numeric(df['UNIT_PRICE'], errors='coerce')
-            df['QUANTITY'] = pd.to_numeric(df['QUANTITY'], errors='coerce')
-            df['CUSTOMER_ID'] = pd.to_numeric(df['CUSTOMER_ID'], errors='coerce')
+            # Number rows by their position in the CSV before any are dropped
+            df['ROW_NUMBER_IN_FILE'] = np.arange(start_row, start_row + len(df), dtype=np.int64)
             
-            # Remove invalid rows
+            # Remove invalid rows with a single boolean mask
             initial_count = len(df)
-            df = df.dropna(subset=['INVOICE_NO', 'STOCK_CODE', 'INVOICE_DATE', 'QUANTITY', 'UNIT_PRICE'])
-            df = df[df['QUANTITY'] != 0]
+            required = ['INVOICE_NO', 'STOCK_CODE', 'INVOICE_DATE', 'QUANTITY', 'UNIT_PRICE']
+            valid = df[required].notna().all(axis=1) & df['QUANTITY'].ne(0).fillna(False)
+            df = df.loc[valid]
             final_count = len(df)
             
             logger.info(f"Cleaned batch {batch_number}: {final_count:,} valid rows, {initial_count - final_count:,} rejected")
+
+            # Nothing survived validation; skip the transient table round trips
+            if df.empty:
+                logger.warning(f"No valid rows in batch {batch_number}")
+                return 0
+
+            # Add metadata and derived columns in one assign (no per-column writes into a filtered slice)
+            quantity = df['QUANTITY'].to_numpy(dtype=np.int64)
+            self._customer_sale_rows = int((df['CUSTOMER_ID'].notna().to_numpy() & (quantity > 0)).sum())
+            # PRODUCTS holds the canonical description, so stage each (stock code, description) pair once
+            repeated_description = df['DESCRIPTION'].notna() & df.duplicated(['STOCK_CODE', 'DESCRIPTION'])
+            df = df.assign(
+                DESCRIPTION=df['DESCRIPTION'].mask(repeated_description),
+                LOAD_TIMESTAMP=datetime.now(),
+                FILE_NAME=f'online_retail_batch_{batch_number}.csv',
+                DATA_SOURCE=f'CSV_BATCH_{batch_number}',
+                HAS_MISSING_CUSTOMER_ID=df['CUSTOMER_ID'].isna().to_numpy(),
+                IS_RETURN=quantity < 0,
+                TOTAL_AMOUNT=quantity * df['UNIT_PRICE'].to_numpy()
+            )
             
-            # Add metadata columns
-            df['LOAD_TIMESTAMP'] = datetime.now()
-            df['FILE_NAME'] = f'online_retail_batch_{batch_number}.csv'
-            df['ROW_NUMBER_IN_FILE'] = range(start_row, start_row + len(df))
-            df['DATA_SOURCE'] = f'CSV_BATCH_{batch_number}'
-            df['HAS_MISSING_CUSTOMER_ID'] = df['CUSTOMER_ID'].isna()
-            df['IS_RETURN'] = df['QUANTITY'] < 0
-            df['TOTAL_AMOUNT'] = df['QUANTITY'] * df['UNIT_PRICE']
-            
-            # Check for duplicates against existing data
-            existing_transactions = self.conn.execute_sql("""
-                SELECT DISTINCT CONCAT(INVOICE_NO, '_', STOCK_CODE, '_', ROW_NUMBER_IN_FILE) as TRANSACTION_KEY
-                FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING
-            """)
-            
-            if existing_transactions is not None and not existing_transactions.empty:
-                existing_keys = set(existing_transactions['TRANSACTION_KEY'].tolist())
-                df['TRANSACTION_KEY'] = df['INVOICE_NO'] + '_' + df['STOCK_CODE'] + '_' + df['ROW_NUMBER_IN_FILE'].astype(str)
-                
-                # Filter out duplicates
-                before_dedup = len(df)
-                df = df[~df['TRANSACTION_KEY'].isin(existing_keys)]
-                after_dedup = len(df)
+            # Land the batch in a transient table, then let Snowflake drop rows already in staging
+            df = df[STAGING_COLUMNS]
+            batch_table = f'ONLINE_RETAIL_STAGING_TMP_{batch_number}'
+            try:
+                if not self.conn.load_dataframe(df, batch_table, if_exists='replace', schema='RAW_DATA',
+                                                chunk_size=LOAD_CHUNK_ROWS, table_type='transient'):
+                    return 0
                 
-                if before_dedup > after_dedup:
-                    logger.info(f"Removed {before_dedup - after_dedup} duplicate transactions")
-                
-                # Drop the temporary key column
-                df = df.drop('TRANSACTION_KEY', axis=1)
+                # Dedup compares a fixed-width 64-bit fingerprint rather than three columns
+                columns = ', '.join(STAGING_COLUMNS)
+                loaded_count = self.conn.execute_dml(f"""
+                    INSERT INTO RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING ({columns}, TRANSACTION_HASH)
+                    SELECT {columns}, s.TRANSACTION_HASH
+                    FROM (
+                        SELECT *, {TRANSACTION_HASH_SQL} AS TRANSACTION_HASH
+                        FROM RETAIL_DATALAKE.RAW_DATA.{batch_table}
+                    ) s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING t
+                        WHERE t.TRANSACTION_HASH = s.TRANSACTION_HASH
+                    )
+                """)
+            finally:
+                self.conn.execute_sql(f"DROP TABLE IF EXISTS RETAIL_DATALAKE.RAW_DATA.{batch_table}")
+            
+            # Rows skipped as duplicates are already staged, so the batch maximum is now staged either way
+            if self._last_row is not None and not df.empty:
+                self._last_row = max(self._last_row, int(df['ROW_NUMBER_IN_FILE'].max()))
+            
+            if len(df) > loaded_count:
+                logger.info(f"Removed {len(df) - loaded_count} duplicate transactions")
             
-            if df.empty:
+            if loaded_count == 0:
                 logger.warning(f"No new records to load for batch {batch_number} after deduplication")
                 return 0
             
-            # Load to staging using individual INSERTs (optimized)
-            loaded_count = 0
-            for idx, row in df.iterrows():
-                try:
-                    # Prepare values with proper escaping
-                    invoice_no = str(row['INVOICE_NO']).replace("'", "''")
-                    stock_code = str(row['STOCK_CODE']).replace("'", "''")
-                    description = str(row['DESCRIPTION']).replace("'", "''") if pd.notna(row['DESCRIPTION']) else 'NULL'
-                    quantity = row['QUANTITY']
-                    invoice_date = row['INVOICE_DATE'].strftime('%Y-%m-%d %H:%M:%S')
-                    unit_price = row['UNIT_PRICE']
-                    customer_id = int(row['CUSTOMER_ID']) if pd.notna(row['CUSTOMER_ID']) else 'NULL'
-                    country = str(row['COUNTRY']).replace("'", "''")
-                    load_timestamp = row['LOAD_TIMESTAMP'].strftime('%Y-%m-%d %H:%M:%S')
-                    file_name = row['FILE_NAME']
-                    row_number = row['ROW_NUMBER_IN_FILE']
-                    data_source = row['DATA_SOURCE']
-                    has_missing_customer = 'TRUE' if row['HAS_MISSING_CUSTOMER_ID'] else 'FALSE'
-                    is_return = 'TRUE' if row['IS_RETURN'] else 'FALSE'
-                    total_amount = row['TOTAL_AMOUNT']
-                    
-                    desc_value = f"'{description}'" if description != 'NULL' else 'NULL'
-                    
-                    insert_sql = f"""
-                    INSERT INTO RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING 
-                    (INVOICE_NO, STOCK_CODE, DESCRIPTION, QUANTITY, INVOICE_DATE, UNIT_PRICE, 
-                     CUSTOMER_ID, COUNTRY, LOAD_TIMESTAMP, FILE_NAME, ROW_NUMBER_IN_FILE, 
-                     DATA_SOURCE, HAS_MISSING_CUSTOMER_ID, IS_RETURN, TOTAL_AMOUNT)
-                    VALUES ('{invoice_no}', '{stock_code}', {desc_value}, {quantity}, 
-                            '{invoice_date}', {unit_price}, {customer_id}, '{country}',
-                            '{load_timestamp}', '{file_name}', {row_number}, '{data_source}',
-                            {has_missing_customer}, {is_return}, {total_amount})
-                    """
-                    
-                    self.conn.execute_sql(insert_sql)
-                    loaded_count += 1
-                    
-                    if loaded_count % 100 == 0:
-                        logger.info(f"Loaded {loaded_count}/{len(df)} rows for batch {batch_number}")
-                        
-                except Exception as e:
-                    logger.error(f"Failed to insert row {idx}: {e}")
-                    continue
-            
             logger.info(f"✅ Batch {batch_number}: {loaded_count} records loaded to staging")
             return loaded_count
             
@@ -212,141 +280,248 @@ class IncrementalETLPipeline:
             logger.error(f"Error loading batch {batch_number}: {e}")
             return 0
     
-    def update_dimensions_incremental(self, batch_number: int):
-        """Update dimension tables with new data"""
+    def update_dimensions_incremental(self, batch_number: int, include_customers: bool = True):
+        """Update dimension tables with new data, optionally skipping the CUSTOMERS MERGE when it has no input"""
         logger.info(f"Updating dimensions for batch {batch_number}...")
         
-        try:
-            # Update Products dimension (UPSERT logic)
-            products_sql = """
-            MERGE INTO RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS AS target
-            USING (
+        # Scan staging once for the current batch (exact DATA_SOURCE match prunes to its micro-partitions)
+        # and precompute the sale-only columns every dimension aggregates
+        batch_sql = f"""
+        CREATE OR REPLACE TEMPORARY TABLE BATCH_ROWS AS
+        SELECT 
+            INVOICE_NO,
+            STOCK_CODE,
+            DESCRIPTION,
+            CUSTOMER_ID,
+            COUNTRY,
+            INVOICE_DATE,
+            QUANTITY > 0 as IS_SALE,
+            IFF(QUANTITY > 0, QUANTITY, 0) as SALE_QUANTITY,
+            IFF(QUANTITY > 0, TOTAL_AMOUNT, 0) as SALE_AMOUNT,
+            IFF(QUANTITY > 0, UNIT_PRICE, NULL) as SALE_PRICE,
+            IFF(QUANTITY > 0, INVOICE_DATE, NULL) as SALE_DATE,
+            IFF(QUANTITY > 0, CUSTOMER_ID, NULL) as SALE_CUSTOMER_ID
+        FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING
+        WHERE DATA_SOURCE = 'CSV_BATCH_{batch_number}'
+        """
+        
+        # Update Products dimension (UPSERT logic)
+        products_sql = """
+        MERGE INTO RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS AS target
+        USING (
+            WITH batch_products AS (
                 SELECT 
                     STOCK_CODE,
                     MAX(DESCRIPTION) as DESCRIPTION,
-                    SUM(CASE WHEN QUANTITY > 0 THEN QUANTITY ELSE 0 END) as NEW_QUANTITY_SOLD,
-                    SUM(CASE WHEN QUANTITY > 0 THEN TOTAL_AMOUNT ELSE 0 END) as NEW_REVENUE,
-                    AVG(CASE WHEN QUANTITY > 0 THEN UNIT_PRICE ELSE NULL END) as AVG_UNIT_PRICE,
-                    MIN(CASE WHEN QUANTITY > 0 THEN UNIT_PRICE ELSE NULL END) as MIN_UNIT_PRICE,
-                    MAX(CASE WHEN QUANTITY > 0 THEN UNIT_PRICE ELSE NULL END) as MAX_UNIT_PRICE,
-                    MIN(CASE WHEN QUANTITY > 0 THEN INVOICE_DATE ELSE NULL END) as FIRST_SALE_DATE,
-                    MAX(CASE WHEN QUANTITY > 0 THEN INVOICE_DATE ELSE NULL END) as LAST_SALE_DATE,
-                    COUNT(DISTINCT CASE WHEN QUANTITY > 0 THEN CUSTOMER_ID ELSE NULL END) as NEW_UNIQUE_CUSTOMERS
-                FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING
-                WHERE DATA_SOURCE LIKE '%BATCH_%'
-                AND STOCK_CODE IS NOT NULL
+                    SUM(SALE_QUANTITY) as NEW_QUANTITY_SOLD,
+                    SUM(SALE_AMOUNT) as NEW_REVENUE,
+                    -- Return-only groups have no SALE_PRICE; keep the running sum at 0, not NULL
+                    COALESCE(SUM(SALE_PRICE), 0) as UNIT_PRICE_SUM,
+                    COUNT(SALE_PRICE) as UNIT_PRICE_COUNT,
+                    AVG(SALE_PRICE) as AVG_UNIT_PRICE,
+                    MIN(SALE_PRICE) as MIN_UNIT_PRICE,
+                    MAX(SALE_PRICE) as MAX_UNIT_PRICE,
+                    MIN(SALE_DATE) as FIRST_SALE_DATE,
+                    MAX(SALE_DATE) as LAST_SALE_DATE,
+                    HLL_ACCUMULATE(SALE_CUSTOMER_ID) as NEW_CUSTOMERS_SKETCH
+                FROM BATCH_ROWS
+                WHERE STOCK_CODE IS NOT NULL
                 GROUP BY STOCK_CODE
-            ) AS source
-            ON target.STOCK_CODE = source.STOCK_CODE
-            WHEN MATCHED THEN UPDATE SET
-                DESCRIPTION = COALESCE(source.DESCRIPTION, target.DESCRIPTION),
-                TOTAL_QUANTITY_SOLD = target.TOTAL_QUANTITY_SOLD + source.NEW_QUANTITY_SOLD,
-                TOTAL_REVENUE = target.TOTAL_REVENUE + source.NEW_REVENUE,
-                AVERAGE_UNIT_PRICE = (target.AVERAGE_UNIT_PRICE + source.AVG_UNIT_PRICE) / 2,
-                MIN_UNIT_PRICE = LEAST(target.MIN_UNIT_PRICE, source.MIN_UNIT_PRICE),
-                MAX_UNIT_PRICE = GREATEST(target.MAX_UNIT_PRICE, source.MAX_UNIT_PRICE),
-                FIRST_SALE_DATE = LEAST(target.FIRST_SALE_DATE, source.FIRST_SALE_DATE),
-                LAST_SALE_DATE = GREATEST(target.LAST_SALE_DATE, source.LAST_SALE_DATE),
-                UNIQUE_CUSTOMERS = target.UNIQUE_CUSTOMERS + source.NEW_UNIQUE_CUSTOMERS,
-                UPDATED_AT = CURRENT_TIMESTAMP()
-            WHEN NOT MATCHED THEN INSERT 
-                (STOCK_CODE, DESCRIPTION, TOTAL_QUANTITY_SOLD, TOTAL_REVENUE, 
-                 AVERAGE_UNIT_PRICE, MIN_UNIT_PRICE, MAX_UNIT_PRICE, 
-                 FIRST_SALE_DATE, LAST_SALE_DATE, UNIQUE_CUSTOMERS)
-            VALUES 
-                (source.STOCK_CODE, source.DESCRIPTION, source.NEW_QUANTITY_SOLD, source.NEW_REVENUE,
-                 source.AVG_UNIT_PRICE, source.MIN_UNIT_PRICE, source.MAX_UNIT_PRICE,
-                 source.FIRST_SALE_DATE, source.LAST_SALE_DATE, source.NEW_UNIQUE_CUSTOMERS)
-            """
-            self.conn.execute_sql(products_sql)
-            logger.info("✅ Products dimension updated")
-            
-            # Update Customers dimension (similar UPSERT logic)
-            customers_sql = """
-            MERGE INTO RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS AS target
-            USING (
+            ),
+            -- HLL states only merge through the HLL_COMBINE aggregate, so union the stored sketch in
+            sketches AS (
+                SELECT STOCK_CODE, HLL_COMBINE(SKETCH) as CUSTOMERS_SKETCH
+                FROM (
+                    SELECT STOCK_CODE, NEW_CUSTOMERS_SKETCH as SKETCH FROM batch_products
+                    UNION ALL
+                    SELECT p.STOCK_CODE, p.UNIQUE_CUSTOMERS_SKETCH
+                    FROM RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS p
+                    JOIN batch_products b ON p.STOCK_CODE = b.STOCK_CODE
+                    WHERE p.UNIQUE_CUSTOMERS_SKETCH IS NOT NULL
+                )
+                GROUP BY STOCK_CODE
+            )
+            SELECT b.*, s.CUSTOMERS_SKETCH, HLL_ESTIMATE(s.CUSTOMERS_SKETCH) as UNIQUE_CUSTOMERS
+            FROM batch_products b
+            JOIN sketches s ON b.STOCK_CODE = s.STOCK_CODE
+        ) AS source
+        ON target.STOCK_CODE = source.STOCK_CODE
+        WHEN MATCHED THEN UPDATE SET
+            DESCRIPTION = COALESCE(source.DESCRIPTION, target.DESCRIPTION),
+            TOTAL_QUANTITY_SOLD = target.TOTAL_QUANTITY_SOLD + source.NEW_QUANTITY_SOLD,
+            TOTAL_REVENUE = target.TOTAL_REVENUE + source.NEW_REVENUE,
+            UNIT_PRICE_SUM = target.UNIT_PRICE_SUM + source.UNIT_PRICE_SUM,
+            UNIT_PRICE_COUNT = target.UNIT_PRICE_COUNT + source.UNIT_PRICE_COUNT,
+            AVERAGE_UNIT_PRICE = COALESCE(
+                (target.UNIT_PRICE_SUM + source.UNIT_PRICE_SUM) / NULLIF(target.UNIT_PRICE_COUNT + source.UNIT_PRICE_COUNT, 0),
+                target.AVERAGE_UNIT_PRICE),
+            MIN_UNIT_PRICE = LEAST(target.MIN_UNIT_PRICE, source.MIN_UNIT_PRICE),
+            MAX_UNIT_PRICE = GREATEST(target.MAX_UNIT_PRICE, source.MAX_UNIT_PRICE),
+            FIRST_SALE_DATE = LEAST(target.FIRST_SALE_DATE, source.FIRST_SALE_DATE),
+            LAST_SALE_DATE = GREATEST(target.LAST_SALE_DATE, source.LAST_SALE_DATE),
+            UNIQUE_CUSTOMERS = source.UNIQUE_CUSTOMERS,
+            UNIQUE_CUSTOMERS_SKETCH = source.CUSTOMERS_SKETCH,
+            UPDATED_AT = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT 
+            (STOCK_CODE, DESCRIPTION, TOTAL_QUANTITY_SOLD, TOTAL_REVENUE, 
+             AVERAGE_UNIT_PRICE, MIN_UNIT_PRICE, MAX_UNIT_PRICE, UNIT_PRICE_SUM, UNIT_PRICE_COUNT,
+             FIRST_SALE_DATE, LAST_SALE_DATE, UNIQUE_CUSTOMERS, UNIQUE_CUSTOMERS_SKETCH)
+        VALUES 
+            (source.STOCK_CODE, source.DESCRIPTION, source.NEW_QUANTITY_SOLD, source.NEW_REVENUE,
+             source.AVG_UNIT_PRICE, source.MIN_UNIT_PRICE, source.MAX_UNIT_PRICE,
+             source.UNIT_PRICE_SUM, source.UNIT_PRICE_COUNT,
+             source.FIRST_SALE_DATE, source.LAST_SALE_DATE, source.UNIQUE_CUSTOMERS, source.CUSTOMERS_SKETCH)
+        """
+        
+        # Update Customers dimension (similar UPSERT logic)
+        customers_sql = """
+        MERGE INTO RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS AS target
+        USING (
+            WITH batch_customers AS (
                 SELECT 
                     CUSTOMER_ID,
                     MAX(COUNTRY) as COUNTRY,
                     MIN(INVOICE_DATE) as FIRST_PURCHASE_DATE,
                     MAX(INVOICE_DATE) as LAST_PURCHASE_DATE,
-                    COUNT(DISTINCT INVOICE_NO) as NEW_ORDERS,
-                    SUM(CASE WHEN QUANTITY > 0 THEN QUANTITY ELSE 0 END) as NEW_ITEMS_PURCHASED,
-                    SUM(CASE WHEN QUANTITY > 0 THEN TOTAL_AMOUNT ELSE 0 END) as NEW_AMOUNT_SPENT,
-                    AVG(CASE WHEN QUANTITY > 0 THEN TOTAL_AMOUNT ELSE NULL END) as AVG_ORDER_VALUE
-                FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING
-                WHERE DATA_SOURCE LIKE '%BATCH_%'
-                AND CUSTOMER_ID IS NOT NULL AND QUANTITY > 0
+                    HLL_ACCUMULATE(INVOICE_NO) as NEW_ORDERS_SKETCH,
+                    SUM(SALE_QUANTITY) as NEW_ITEMS_PURCHASED,
+                    SUM(SALE_AMOUNT) as NEW_AMOUNT_SPENT,
+                    COUNT(*) as NEW_SALE_LINES,
+                    AVG(SALE_AMOUNT) as AVG_ORDER_VALUE
+                FROM BATCH_ROWS
+                WHERE CUSTOMER_ID IS NOT NULL AND IS_SALE
                 GROUP BY CUSTOMER_ID
-            ) AS source
-            ON target.CUSTOMER_ID = source.CUSTOMER_ID
-            WHEN MATCHED THEN UPDATE SET
-                COUNTRY = COALESCE(source.COUNTRY, target.COUNTRY),
-                FIRST_PURCHASE_DATE = LEAST(target.FIRST_PURCHASE_DATE, source.FIRST_PURCHASE_DATE),
-                LAST_PURCHASE_DATE = GREATEST(target.LAST_PURCHASE_DATE, source.LAST_PURCHASE_DATE),
-                TOTAL_ORDERS = target.TOTAL_ORDERS + source.NEW_ORDERS,
-                TOTAL_ITEMS_PURCHASED = target.TOTAL_ITEMS_PURCHASED + source.NEW_ITEMS_PURCHASED,
-                TOTAL_AMOUNT_SPENT = target.TOTAL_AMOUNT_SPENT + source.NEW_AMOUNT_SPENT,
-                AVERAGE_ORDER_VALUE = (target.AVERAGE_ORDER_VALUE + source.AVG_ORDER_VALUE) / 2,
-                UPDATED_AT = CURRENT_TIMESTAMP()
-            WHEN NOT MATCHED THEN INSERT 
-                (CUSTOMER_ID, COUNTRY, FIRST_PURCHASE_DATE, LAST_PURCHASE_DATE,
-                 TOTAL_ORDERS, TOTAL_ITEMS_PURCHASED, TOTAL_AMOUNT_SPENT, AVERAGE_ORDER_VALUE)
-            VALUES 
-                (source.CUSTOMER_ID, source.COUNTRY, source.FIRST_PURCHASE_DATE, source.LAST_PURCHASE_DATE,
-                 source.NEW_ORDERS, source.NEW_ITEMS_PURCHASED, source.NEW_AMOUNT_SPENT, source.AVG_ORDER_VALUE)
-            """
-            self.conn.execute_sql(customers_sql)
-            
-            # Update customer segments
-            segment_sql = """
-            UPDATE RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS 
-            SET CUSTOMER_SEGMENT = CASE 
-                WHEN TOTAL_AMOUNT_SPENT >= 10000 THEN 'VIP'
-                WHEN TOTAL_AMOUNT_SPENT >= 5000 THEN 'HIGH_VALUE'
-                WHEN TOTAL_AMOUNT_SPENT >= 1000 THEN 'MEDIUM_VALUE'
-                WHEN TOTAL_AMOUNT_SPENT > 0 THEN 'LOW_VALUE'
-                ELSE 'NEW'
-            END,
-            DAYS_SINCE_LAST_PURCHASE = DATEDIFF('day', LAST_PURCHASE_DATE, CURRENT_DATE())
-            WHERE UPDATED_AT >= CURRENT_DATE()
-            """
-            self.conn.execute_sql(segment_sql)
-            logger.info("✅ Customers dimension updated")
-            
-            # Update Countries dimension
-            countries_sql = """
-            MERGE INTO RETAIL_DATALAKE.PROCESSED_DATA.COUNTRIES AS target
-            USING (
+            ),
+            sketches AS (
+                SELECT CUSTOMER_ID, HLL_COMBINE(SKETCH) as ORDERS_SKETCH
+                FROM (
+                    SELECT CUSTOMER_ID, NEW_ORDERS_SKETCH as SKETCH FROM batch_customers
+                    UNION ALL
+                    SELECT c.CUSTOMER_ID, c.ORDERS_SKETCH
+                    FROM RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS c
+                    JOIN batch_customers b ON c.CUSTOMER_ID = b.CUSTOMER_ID
+                    WHERE c.ORDERS_SKETCH IS NOT NULL
+                )
+                GROUP BY CUSTOMER_ID
+            )
+            SELECT b.*, s.ORDERS_SKETCH, HLL_ESTIMATE(s.ORDERS_SKETCH) as TOTAL_ORDERS
+            FROM batch_customers b
+            JOIN sketches s ON b.CUSTOMER_ID = s.CUSTOMER_ID
+        ) AS source
+        ON target.CUSTOMER_ID = source.CUSTOMER_ID
+        WHEN MATCHED THEN UPDATE SET
+            COUNTRY = COALESCE(source.COUNTRY, target.COUNTRY),
+            FIRST_PURCHASE_DATE = LEAST(target.FIRST_PURCHASE_DATE, source.FIRST_PURCHASE_DATE),
+            LAST_PURCHASE_DATE = GREATEST(target.LAST_PURCHASE_DATE, source.LAST_PURCHASE_DATE),
+            TOTAL_ORDERS = source.TOTAL_ORDERS,
+            ORDERS_SKETCH = source.ORDERS_SKETCH,
+            TOTAL_ITEMS_PURCHASED = target.TOTAL_ITEMS_PURCHASED + source.NEW_ITEMS_PURCHASED,
+            TOTAL_AMOUNT_SPENT = target.TOTAL_AMOUNT_SPENT + source.NEW_AMOUNT_SPENT,
+            SALE_LINE_COUNT = target.SALE_LINE_COUNT + source.NEW_SALE_LINES,
+            AVERAGE_ORDER_VALUE = (target.TOTAL_AMOUNT_SPENT + source.NEW_AMOUNT_SPENT)
+                / NULLIF(target.SALE_LINE_COUNT + source.NEW_SALE_LINES, 0),
+            UPDATED_AT = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT 
+            (CUSTOMER_ID, COUNTRY, FIRST_PURCHASE_DATE, LAST_PURCHASE_DATE,
+             TOTAL_ORDERS, TOTAL_ITEMS_PURCHASED, TOTAL_AMOUNT_SPENT, AVERAGE_ORDER_VALUE, SALE_LINE_COUNT,
+             ORDERS_SKETCH)
+        VALUES 
+            (source.CUSTOMER_ID, source.COUNTRY, source.FIRST_PURCHASE_DATE, source.LAST_PURCHASE_DATE,
+             source.TOTAL_ORDERS, source.NEW_ITEMS_PURCHASED, source.NEW_AMOUNT_SPENT, source.AVG_ORDER_VALUE,
+             source.NEW_SALE_LINES, source.ORDERS_SKETCH)
+        """
+        
+        # Assign surrogate ids to invoice numbers seen for the first time (insert-only, so idempotent)
+        invoices_sql = """
+        MERGE INTO RETAIL_DATALAKE.PROCESSED_DATA.INVOICES AS target
+        USING (SELECT DISTINCT INVOICE_NO FROM BATCH_ROWS WHERE INVOICE_NO IS NOT NULL) AS source
+        ON target.INVOICE_NO = source.INVOICE_NO
+        WHEN NOT MATCHED THEN INSERT (INVOICE_NO) VALUES (source.INVOICE_NO)
+        """
+        
+        # Update customer segments
+        segment_sql = """
+        UPDATE RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS 
+        SET CUSTOMER_SEGMENT = CASE 
+            WHEN TOTAL_AMOUNT_SPENT >= 10000 THEN 'VIP'
+            WHEN TOTAL_AMOUNT_SPENT >= 5000 THEN 'HIGH_VALUE'
+            WHEN TOTAL_AMOUNT_SPENT >= 1000 THEN 'MEDIUM_VALUE'
+            WHEN TOTAL_AMOUNT_SPENT > 0 THEN 'LOW_VALUE'
+            ELSE 'NEW'
+        END,
+        DAYS_SINCE_LAST_PURCHASE = DATEDIFF('day', LAST_PURCHASE_DATE, CURRENT_DATE())
+        WHERE UPDATED_AT >= CURRENT_DATE()
+        """
+        
+        # Update Countries dimension
+        countries_sql = """
+        MERGE INTO RETAIL_DATALAKE.PROCESSED_DATA.COUNTRIES AS target
+        USING (
+            WITH batch_countries AS (
                 SELECT 
                     COUNTRY,
-                    COUNT(DISTINCT CUSTOMER_ID) as NEW_CUSTOMERS,
-                    COUNT(DISTINCT INVOICE_NO) as NEW_ORDERS,
-                    SUM(CASE WHEN QUANTITY > 0 THEN TOTAL_AMOUNT ELSE 0 END) as NEW_REVENUE,
+                    HLL_ACCUMULATE(CUSTOMER_ID) as NEW_CUSTOMERS_SKETCH,
+                    HLL_ACCUMULATE(INVOICE_NO) as NEW_ORDERS_SKETCH,
+                    SUM(SALE_AMOUNT) as NEW_REVENUE,
                     MIN(INVOICE_DATE) as FIRST_ORDER_DATE,
                     MAX(INVOICE_DATE) as LAST_ORDER_DATE
-                FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING
-                WHERE DATA_SOURCE LIKE '%BATCH_%'
-                AND COUNTRY IS NOT NULL
+                FROM BATCH_ROWS
+                WHERE COUNTRY IS NOT NULL
                 GROUP BY COUNTRY
-            ) AS source
-            ON target.COUNTRY = source.COUNTRY
-            WHEN MATCHED THEN UPDATE SET
-                TOTAL_CUSTOMERS = target.TOTAL_CUSTOMERS + source.NEW_CUSTOMERS,
-                TOTAL_ORDERS = target.TOTAL_ORDERS + source.NEW_ORDERS,
-                TOTAL_REVENUE = target.TOTAL_REVENUE + source.NEW_REVENUE,
-                FIRST_ORDER_DATE = LEAST(target.FIRST_ORDER_DATE, source.FIRST_ORDER_DATE),
-                LAST_ORDER_DATE = GREATEST(target.LAST_ORDER_DATE, source.LAST_ORDER_DATE),
-                UPDATED_AT = CURRENT_TIMESTAMP()
-            WHEN NOT MATCHED THEN INSERT 
-                (COUNTRY, TOTAL_CUSTOMERS, TOTAL_ORDERS, TOTAL_REVENUE,
-                 FIRST_ORDER_DATE, LAST_ORDER_DATE)
-            VALUES 
-                (source.COUNTRY, source.NEW_CUSTOMERS, source.NEW_ORDERS, source.NEW_REVENUE,
-                 source.FIRST_ORDER_DATE, source.LAST_ORDER_DATE)
-            """
-            self.conn.execute_sql(countries_sql)
-            logger.info("✅ Countries dimension updated")
+            ),
+            sketches AS (
+                SELECT COUNTRY,
+                    HLL_COMBINE(CUSTOMERS_SKETCH) as CUSTOMERS_SKETCH,
+                    HLL_COMBINE(ORDERS_SKETCH) as ORDERS_SKETCH
+                FROM (
+                    SELECT COUNTRY, NEW_CUSTOMERS_SKETCH as CUSTOMERS_SKETCH, NEW_ORDERS_SKETCH as ORDERS_SKETCH
+                    FROM batch_countries
+                    UNION ALL
+                    SELECT k.COUNTRY, k.CUSTOMERS_SKETCH, k.ORDERS_SKETCH
+                    FROM RETAIL_DATALAKE.PROCESSED_DATA.COUNTRIES k
+                    JOIN batch_countries b ON k.COUNTRY = b.COUNTRY
+                    WHERE k.CUSTOMERS_SKETCH IS NOT NULL
+                )
+                GROUP BY COUNTRY
+            )
+            SELECT b.COUNTRY, b.NEW_REVENUE, b.FIRST_ORDER_DATE, b.LAST_ORDER_DATE,
+                s.CUSTOMERS_SKETCH, s.ORDERS_SKETCH,
+                HLL_ESTIMATE(s.CUSTOMERS_SKETCH) as TOTAL_CUSTOMERS,
+                HLL_ESTIMATE(s.ORDERS_SKETCH) as TOTAL_ORDERS
+            FROM batch_countries b
+            JOIN sketches s ON b.COUNTRY = s.COUNTRY
+        ) AS source
+        ON target.COUNTRY = source.COUNTRY
+        WHEN MATCHED THEN UPDATE SET
+            TOTAL_CUSTOMERS = source.TOTAL_CUSTOMERS,
+            TOTAL_ORDERS = source.TOTAL_ORDERS,
+            CUSTOMERS_SKETCH = source.CUSTOMERS_SKETCH,
+            ORDERS_SKETCH = source.ORDERS_SKETCH,
+            TOTAL_REVENUE = target.TOTAL_REVENUE + source.NEW_REVENUE,
+            FIRST_ORDER_DATE = LEAST(target.FIRST_ORDER_DATE, source.FIRST_ORDER_DATE),
+            LAST_ORDER_DATE = GREATEST(target.LAST_ORDER_DATE, source.LAST_ORDER_DATE),
+            UPDATED_AT = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT 
+            (COUNTRY, TOTAL_CUSTOMERS, TOTAL_ORDERS, TOTAL_REVENUE,
+             FIRST_ORDER_DATE, LAST_ORDER_DATE, CUSTOMERS_SKETCH, ORDERS_SKETCH)
+        VALUES 
+            (source.COUNTRY, source.TOTAL_CUSTOMERS, source.TOTAL_ORDERS, source.NEW_REVENUE,
+             source.FIRST_ORDER_DATE, source.LAST_ORDER_DATE, source.CUSTOMERS_SKETCH, source.ORDERS_SKETCH)
+        """
+        
+        try:
+            # One session, so the temporary BATCH_ROWS table is visible to every statement;
+            # the MERGEs touch different tables and run concurrently on the warehouse
+            merges = [products_sql, countries_sql, invoices_sql]
+            cleanup = ["DROP TABLE IF EXISTS BATCH_ROWS"]
+            if include_customers:
+                merges.append(customers_sql)
+                cleanup.insert(0, segment_sql)
+            else:
+                logger.info(f"No customer sales in batch {batch_number}; skipping customers MERGE")
+            
+            self.conn.execute_stages([[batch_sql], merges, cleanup])
+            logger.info("✅ Dimensions updated")
             
         except Exception as e:
             logger.error(f"Error updating dimensions: {e}")
@@ -357,40 +532,45 @@ class IncrementalETLPipeline:
         logger.info(f"Appending batch {batch_number} to transactions fact table...")
         
         try:
+            # Surrogate keys come from PRODUCTS and INVOICES, both populated in update_dimensions_incremental;
+            # the ANALYTICS views count and join on these ids
             transactions_sql = f"""
             INSERT INTO RETAIL_DATALAKE.PROCESSED_DATA.TRANSACTIONS 
-            (TRANSACTION_ID, INVOICE_NO, STOCK_CODE, CUSTOMER_ID, DESCRIPTION,
+            (TRANSACTION_ID, INVOICE_NO, STOCK_CODE, INVOICE_NO_ID, STOCK_CODE_ID, CUSTOMER_ID,
              QUANTITY, UNIT_PRICE, TOTAL_AMOUNT, INVOICE_DATE, INVOICE_YEAR,
              INVOICE_MONTH, INVOICE_DAY_OF_WEEK, COUNTRY, TRANSACTION_TYPE,
              IS_GUEST_PURCHASE, SOURCE_FILE)
             SELECT 
-                CONCAT(INVOICE_NO, '_', STOCK_CODE, '_', ROW_NUMBER_IN_FILE) as TRANSACTION_ID,
-                INVOICE_NO,
-                STOCK_CODE,
-                CUSTOMER_ID,
-                DESCRIPTION,
-                QUANTITY,
-                UNIT_PRICE,
-                TOTAL_AMOUNT,
-                INVOICE_DATE,
-                YEAR(INVOICE_DATE) as INVOICE_YEAR,
-                MONTH(INVOICE_DATE) as INVOICE_MONTH,
-                DAYOFWEEK(INVOICE_DATE) as INVOICE_DAY_OF_WEEK,
-                COUNTRY,
+                CONCAT(s.INVOICE_NO, '_', s.STOCK_CODE, '_', s.ROW_NUMBER_IN_FILE) as TRANSACTION_ID,
+                s.INVOICE_NO,
+                s.STOCK_CODE,
+                i.INVOICE_NO_ID,
+                p.STOCK_CODE_ID,
+                s.CUSTOMER_ID,
+                s.QUANTITY,
+                s.UNIT_PRICE,
+                s.TOTAL_AMOUNT,
+                s.INVOICE_DATE,
+                YEAR(s.INVOICE_DATE) as INVOICE_YEAR,
+                MONTH(s.INVOICE_DATE) as INVOICE_MONTH,
+                DAYOFWEEK(s.INVOICE_DATE) as INVOICE_DAY_OF_WEEK,
+                s.COUNTRY,
                 CASE 
-                    WHEN QUANTITY > 0 THEN 'SALE'
-                    WHEN QUANTITY < 0 THEN 'RETURN'
+                    WHEN s.QUANTITY > 0 THEN 'SALE'
+                    WHEN s.QUANTITY < 0 THEN 'RETURN'
                     ELSE 'UNKNOWN'
                 END as TRANSACTION_TYPE,
-                CASE WHEN CUSTOMER_ID IS NULL THEN TRUE ELSE FALSE END as IS_GUEST_PURCHASE,
-                FILE_NAME as SOURCE_FILE
-            FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING
-            WHERE DATA_SOURCE = 'CSV_BATCH_{batch_number}'
-            AND INVOICE_NO IS NOT NULL 
-            AND STOCK_CODE IS NOT NULL 
-            AND QUANTITY IS NOT NULL 
-            AND UNIT_PRICE IS NOT NULL
-            AND QUANTITY != 0
+                CASE WHEN s.CUSTOMER_ID IS NULL THEN TRUE ELSE FALSE END as IS_GUEST_PURCHASE,
+                s.FILE_NAME as SOURCE_FILE
+            FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING s
+            LEFT JOIN RETAIL_DATALAKE.PROCESSED_DATA.INVOICES i ON i.INVOICE_NO = s.INVOICE_NO
+            LEFT JOIN RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS p ON p.STOCK_CODE = s.STOCK_CODE
+            WHERE s.DATA_SOURCE = 'CSV_BATCH_{batch_number}'
+            AND s.INVOICE_NO IS NOT NULL 
+            AND s.STOCK_CODE IS NOT NULL 
+            AND s.QUANTITY IS NOT NULL 
+            AND s.UNIT_PRICE IS NOT NULL
+            AND s.QUANTITY != 0
             """
             
             self.conn.execute_sql(transactions_sql)
@@ -400,22 +580,35 @@ class IncrementalETLPipeline:
             logger.error(f"Error appending to transactions: {e}")
             raise
     
+    def refresh_sales_rollup(self):
+        """Trigger the daily sales rollup refresh so API metrics include the new batch"""
+        try:
+            self.conn.execute_sql("EXECUTE TASK RETAIL_DATALAKE.ANALYTICS.REFRESH_SALES_DAILY_ROLLUP")
+            logger.info("✅ Sales rollup refresh triggered")
+        except Exception as e:
+            logger.warning(f"Could not trigger sales rollup refresh: {e}")
+    
     def get_data_summary(self):
-        """Get current data summary"""
+        """Get current data summary (and refresh the last processed row) in one round trip"""
         try:
-            staging_count = self.conn.execute_sql("SELECT COUNT(*) FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING")
-            transactions_count = self.conn.execute_sql("SELECT COUNT(*) FROM RETAIL_DATALAKE.PROCESSED_DATA.TRANSACTIONS")
-            products_count = self.conn.execute_sql("SELECT COUNT(*) FROM RETAIL_DATALAKE.PROCESSED_DATA.PRODUCTS")
-            customers_count = self.conn.execute_sql("SELECT COUNT(*) FROM RETAIL_DATALAKE.PROCESSED_DATA.CUSTOMERS")
-            countries_count = self.conn.execute_sql("SELECT COUNT(*) FROM RETAIL_DATALAKE.PROCESSED_DATA.COUNTRIES")
-            
-            return {
-                'staging': staging_count.iloc[0, 0] if staging_count is not None else 0,
-                'transactions': transactions_count.iloc[0, 0] if transactions_count is not None else 0,
-                'products': products_count.iloc[0, 0] if products_count is not None else 0,
-                'customers': customers_count.iloc[0, 0] if customers_count is not None else 0,
-                'countries': countries_count.iloc[0, 0] if countries_count is not None else 0
-            }
+            # Row counts come from INFORMATION_SCHEMA metadata rather than COUNT(*) scans
+            result = self.conn.execute_sql(f"""
+                SELECT
+                    TABLE_NAME,
+                    ROW_COUNT,
+                    (SELECT MAX(ROW_NUMBER_IN_FILE) FROM RETAIL_DATALAKE.RAW_DATA.ONLINE_RETAIL_STAGING) AS LAST_ROW
+                FROM RETAIL_DATALAKE.INFORMATION_SCHEMA.TABLES
+                WHERE TABLE_SCHEMA IN ('RAW_DATA', 'PROCESSED_DATA')
+                AND TABLE_NAME IN ({', '.join(f"'{name}'" for name in SUMMARY_TABLES)})
+            """)
+            if result is None or result.empty:
+                return {}
+            
+            last_row = result['LAST_ROW'].iloc[0]
+            self._last_row = int(last_row) if pd.notna(last_row) else 0
+            counts = dict(zip(result['TABLE_NAME'], result['ROW_COUNT']))
+            return {key: int(counts[name]) if pd.notna(counts.get(name)) else 0
+                    for name, key in SUMMARY_TABLES.items()}
         except Exception as e:
             logger.error(f"Error getting data summary: {e}")
             return {}
@@ -423,6 +616,9 @@ class IncrementalETLPipeline:
     def run_incremental_batch(self, batch_number: int = None):
         """Run incremental batch loading"""
         try:
+            # Get before summary; this also primes the last processed row
+            before_summary = self.get_data_summary()
+            
             # Determine batch number and row range
             if batch_number is None:
                 last_row = self.get_last_processed_row()
@@ -434,9 +630,6 @@ class IncrementalETLPipeline:
             logger.info(f"🚀 Starting incremental batch {batch_number}")
             logger.info(f"📊 Processing rows {start_row:,} to {end_row:,}")
             
-            # Get before summary
-            before_summary = self.get_data_summary()
-            
             # Log batch start
             self.log_batch_start(batch_number, start_row, end_row)
             
@@ -449,10 +642,11 @@ class IncrementalETLPipeline:
                 return False
             
             # Step 2: Update dimensions
-            self.update_dimensions_incremental(batch_number)
+            self.update_dimensions_incremental(batch_number, include_customers=self._customer_sale_rows != 0)
             
             # Step 3: Append to fact table
             self.append_to_transactions_fact(batch_number)
+            self.refresh_sales_rollup()
             
             # Step 4: Log success
             self.log_batch_end(batch_number, 'COMPLETED', loaded_count)
@@ -5,37 +5,113 @@ Tests connection and creates database schema
 """
 
 import sys
-import os
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from config.snowflake_config import SnowflakeConnection, SnowflakeConfig
+import argparse
+import hashlib
+import json
 import logging
+import os
+from typing import TYPE_CHECKING
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+# The config module pulls in the connector, pandas and pyarrow; main() imports it
+# only once credentials are known to be present
+if TYPE_CHECKING:
+    from config.snowflake_config import SnowflakeConnection
+
+CREDENTIAL_VARS = ('SNOWFLAKE_ACCOUNT', 'SNOWFLAKE_USER', 'SNOWFLAKE_PASSWORD')
+
+SCHEMA_DIR = Path(__file__).resolve().parent.parent / "data" / "schemas"
+
+# Fingerprint of the DDL last verified against an account; delete the file to force re-verification
+SCHEMA_CACHE_FILE = Path.home() / ".cache" / "retail_datalake" / "schema_fp.json"
+
+# Schema files in dependency order: the database first, then the raw/processed/metadata
+# schemas, then the views and rollups that read PROCESSED_DATA tables
+SCHEMA_STAGES = [
+    ["01_create_database.sql"],
+    ["02_raw_data_tables.sql", "03_processed_data_tables.sql", "05_metadata_tables.sql"],
+    ["04_analytics_views.sql", "06_analytics_rollups.sql"],
+]
+SCHEMA_FILES = tuple(sql_file for stage in SCHEMA_STAGES for sql_file in stage)
+
+# Schemas expected in RETAIL_DATALAKE, and the ones whose tables/views verify_schema lists
+CATALOG_SCHEMAS = ('RAW_DATA', 'PROCESSED_DATA', 'ANALYTICS', 'METADATA')
+TABLES_SCHEMA = 'RAW_DATA'
+VIEWS_SCHEMA = 'ANALYTICS'
+
+# verify_schema catalog kinds and their section headings
+CATALOG_SECTIONS = {
+    'SCHEMA': "schemas",
+    'TABLE': "tables in RAW_DATA schema",
+    'VIEW': "views in ANALYTICS schema",
+}
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def test_connection():
+def available_schema_files() -> set:
+    """Names of the regular files in SCHEMA_DIR, from a single directory read"""
+    try:
+        with os.scandir(SCHEMA_DIR) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except OSError:
+        return set()
+
+def schema_fingerprint() -> str:
+    """SHA-256 over the schema file names and contents, in execution order"""
+    digest = hashlib.sha256()
+    available = available_schema_files()
+    for sql_file in SCHEMA_FILES:
+        if sql_file in available:
+            digest.update(sql_file.encode())
+            digest.update((SCHEMA_DIR / sql_file).read_bytes())
+    return digest.hexdigest()
+
+def load_cached_fingerprint(account: str):
+    """Return the fingerprint last verified for this account, if any"""
+    try:
+        cached = json.loads(SCHEMA_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return None
+    return cached.get('fingerprint') if cached.get('snowflake_account') == account else None
+
+def save_fingerprint(account: str, fingerprint: str):
+    """Record a successful verification of the current DDL"""
+    try:
+        SCHEMA_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        SCHEMA_CACHE_FILE.write_text(json.dumps({
+            'fingerprint': fingerprint,
+            'snowflake_account': account,
+            'verified_at': datetime.now().isoformat()
+        }))
+    except OSError as e:
+        logger.warning(f"Could not write schema cache {SCHEMA_CACHE_FILE}: {e}")
+
+def print_missing_credentials():
+    """Explain which Snowflake credentials need to be set"""
+    print("❌ Missing Snowflake credentials!")
+    print("Please set the following environment variables:")
+    for var in CREDENTIAL_VARS:
+        print(f"  - {var}")
+    print("\nOr copy .env.example to .env and fill in your credentials")
+
+def test_connection(conn: 'SnowflakeConnection'):
     """Test Snowflake connection"""
     print("🔗 Testing Snowflake Connection...")
     
     try:
-        # Create configuration
-        config = SnowflakeConfig()
+        config = conn.config
         
         # Check if credentials are set
         if not all([config.account, config.user, config.password]):
-            print("❌ Missing Snowflake credentials!")
-            print("Please set the following environment variables:")
-            print("  - SNOWFLAKE_ACCOUNT")
-            print("  - SNOWFLAKE_USER") 
-            print("  - SNOWFLAKE_PASSWORD")
-            print("\nOr copy .env.example to .env and fill in your credentials")
+            print_missing_credentials()
             return False
         
         # Test connection
-        conn = SnowflakeConnection(config)
         success = conn.test_connection()
         
         if success:
@@ -49,34 +125,34 @@ def test_connection():
         print(f"❌ Connection error: {e}")
         return False
 
-def create_database_schema():
+def create_database_schema(conn: 'SnowflakeConnection'):
     """Create the database schema"""
     print("\n🏗️  Creating Database Schema...")
     
     try:
-        config = SnowflakeConfig()
-        conn = SnowflakeConnection(config)
-        
-        # Get schema files directory
-        schema_dir = Path(__file__).parent.parent / "data" / "schemas"
-        
-        # Execute schema files in order
-        schema_files = [
-            "01_create_database.sql",
-            "02_raw_data_tables.sql", 
-            "03_processed_data_tables.sql",
-            "04_analytics_views.sql",
-            "05_metadata_tables.sql"
-        ]
+        # Read every DDL file up front so later stages never wait on disk
+        available = available_schema_files()
+        schema_files = [sql_file for sql_file in SCHEMA_FILES if sql_file in available]
+        for sql_file in sorted(f for f in available - set(SCHEMA_FILES) if f.endswith('.sql')):
+            print(f"⚠️  Skipping {sql_file}: not listed in SCHEMA_STAGES")
+        with ThreadPoolExecutor(max_workers=max(len(schema_files), 1)) as executor:
+            contents = dict(zip(schema_files, executor.map(lambda f: (SCHEMA_DIR / f).read_text(), schema_files)))
         
-        for sql_file in schema_files:
-            file_path = schema_dir / sql_file
-            if file_path.exists():
-                print(f"📄 Executing {sql_file}...")
-                conn.execute_sql_file(str(file_path))
-                print(f"✅ {sql_file} completed")
-            else:
-                print(f"⚠️  File not found: {sql_file}")
+        # Files within a stage are independent and run concurrently on separate pooled sessions
+        for stage in SCHEMA_STAGES:
+            with ThreadPoolExecutor(max_workers=len(stage)) as executor:
+                futures = {}
+                for sql_file in stage:
+                    if sql_file in contents:
+                        print(f"📄 Executing {sql_file}...")
+                        future = executor.submit(conn.execute_sql_file, str(SCHEMA_DIR / sql_file), contents[sql_file])
+                        futures[future] = sql_file
+                    else:
+                        print(f"⚠️  File not found: {sql_file}")
+                
+                for future in as_completed(futures):
+                    future.result()
+                    print(f"✅ {futures[future]} completed")
         
         print("✅ Database schema created successfully!")
         return True
@@ -85,87 +161,102 @@ def create_database_schema():
         print(f"❌ Schema creation failed: {e}")
         return False
 
-def verify_schema():
-    """Verify the created schema"""
+def verify_schema(conn: 'SnowflakeConnection', force: bool = False):
+    """Verify the created schema, unless this exact DDL was already verified for the account"""
     print("\n🔍 Verifying Schema...")
     
     try:
-        config = SnowflakeConfig()
-        conn = SnowflakeConnection(config)
-        
-        # Check databases
-        result = conn.execute_sql("SHOW DATABASES LIKE 'RETAIL_DATALAKE'")
-        if result is not None and not result.empty:
-            print("✅ Database RETAIL_DATALAKE exists")
-        
-        # Check schemas
-        schemas_query = """
-        SELECT SCHEMA_NAME, COMMENT 
-        FROM RETAIL_DATALAKE.INFORMATION_SCHEMA.SCHEMATA 
-        WHERE SCHEMA_NAME IN ('RAW_DATA', 'PROCESSED_DATA', 'ANALYTICS', 'METADATA')
-        ORDER BY SCHEMA_NAME
-        """
-        
-        schemas = conn.execute_sql(schemas_query)
-        if schemas is not None and not schemas.empty:
-            print(f"✅ Found {len(schemas)} schemas:")
-            for _, row in schemas.iterrows():
-                print(f"   • {row['SCHEMA_NAME']}: {row['COMMENT']}")
-        
-        # Check tables in RAW_DATA schema
-        tables_query = """
-        SELECT TABLE_NAME, COMMENT 
-        FROM RETAIL_DATALAKE.INFORMATION_SCHEMA.TABLES 
-        WHERE TABLE_SCHEMA = 'RAW_DATA'
-        ORDER BY TABLE_NAME
-        """
-        
-        tables = conn.execute_sql(tables_query)
-        if tables is not None and not tables.empty:
-            print(f"✅ Found {len(tables)} tables in RAW_DATA schema:")
-            for _, row in tables.iterrows():
-                print(f"   • {row['TABLE_NAME']}")
+        account = conn.config.account
+        fingerprint = schema_fingerprint()
+        if not force and load_cached_fingerprint(account) == fingerprint:
+            print(f"✅ Schema cache valid (DDL unchanged since last verification; delete {SCHEMA_CACHE_FILE} to recheck)")
+            return True
         
-        # Check views in ANALYTICS schema
-        views_query = """
-        SELECT TABLE_NAME as VIEW_NAME, COMMENT 
-        FROM RETAIL_DATALAKE.INFORMATION_SCHEMA.VIEWS 
-        WHERE TABLE_SCHEMA = 'ANALYTICS'
-        ORDER BY TABLE_NAME
+        # Schemas, RAW_DATA tables and ANALYTICS views in one round trip
+        # (the query itself fails if RETAIL_DATALAKE is missing)
+        catalog_query = """
+        SELECT KIND, NAME, COMMENT, COUNT(*) OVER (PARTITION BY KIND) AS KIND_COUNT
+        FROM (
+            SELECT 'SCHEMA' AS KIND, SCHEMA_NAME AS NAME, COMMENT
+            FROM RETAIL_DATALAKE.INFORMATION_SCHEMA.SCHEMATA 
+            WHERE SCHEMA_NAME IN (%s, %s, %s, %s)
+            UNION ALL
+            SELECT 'TABLE', TABLE_NAME, COMMENT 
+            FROM RETAIL_DATALAKE.INFORMATION_SCHEMA.TABLES 
+            WHERE TABLE_SCHEMA = %s
+            UNION ALL
+            SELECT 'VIEW', TABLE_NAME, COMMENT 
+            FROM RETAIL_DATALAKE.INFORMATION_SCHEMA.VIEWS 
+            WHERE TABLE_SCHEMA = %s
+        )
+        ORDER BY KIND, NAME
         """
         
-        views = conn.execute_sql(views_query)
-        if views is not None and not views.empty:
-            print(f"✅ Found {len(views)} views in ANALYTICS schema:")
-            for _, row in views.iterrows():
-                print(f"   • {row['VIEW_NAME']}")
+        # Format rows as they stream in and write the report once; KIND_COUNT lets each
+        # section header precede its rows
+        lines = ["✅ Database RETAIL_DATALAKE exists"]
+        kind = None
+        params = CATALOG_SCHEMAS + (TABLES_SCHEMA, VIEWS_SCHEMA)
+        for row in conn.execute_sql_iter(catalog_query, params):
+            if row['kind'] != kind:
+                kind = row['kind']
+                lines.append(f"✅ Found {row['kind_count']} {CATALOG_SECTIONS[kind]}:")
+            if kind == 'SCHEMA':
+                lines.append(f"   • {row['name']}: {row['comment']}")
+            else:
+                lines.append(f"   • {row['name']}")
+        print("\n".join(lines))
         
+        save_fingerprint(account, fingerprint)
         return True
         
     except Exception as e:
+        # No separate SHOW DATABASES probe: a missing database surfaces here
+        if 'does not exist' in str(e):
+            print("❌ Database RETAIL_DATALAKE does not exist")
         print(f"❌ Schema verification failed: {e}")
         return False
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description='Snowflake Data Lake Setup')
+    parser.add_argument('--force-verify', action='store_true', help='Verify the schema even if the DDL is unchanged')
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("🏔️  SNOWFLAKE DATA LAKE SETUP")
     print("=" * 60)
     
-    # Step 1: Test connection
-    if not test_connection():
+    # Bail out on missing credentials before paying for the connector import
+    from dotenv import load_dotenv
+    load_dotenv()
+    if not all(os.getenv(var) for var in CREDENTIAL_VARS):
+        print("🔗 Testing Snowflake Connection...")
+        print_missing_credentials()
         print("\n❌ Setup failed at connection test")
         return False
     
-    # Step 2: Create schema
-    if not create_database_schema():
-        print("\n❌ Setup failed at schema creation")
-        return False
+    from config.snowflake_config import SnowflakeConnection, get_config
     
-    # Step 3: Verify schema
-    if not verify_schema():
-        print("\n❌ Setup failed at schema verification")
-        return False
+    # One connection (and one login) shared by every step
+    conn = SnowflakeConnection(get_config())
+    try:
+        # Step 1: Test connection
+        if not test_connection(conn):
+            print("\n❌ Setup failed at connection test")
+            return False
+        
+        # Step 2: Create schema
+        if not create_database_schema(conn):
+            print("\n❌ Setup failed at schema creation")
+            return False
+        
+        # Step 3: Verify schema
+        if not verify_schema(conn, force=args.force_verify):
+            print("\n❌ Setup failed at schema verification")
+            return False
+    finally:
+        conn.close()
     
     print("\n" + "=" * 60)
     print("🎉 SNOWFLAKE SETUP COMPLETED SUCCESSFULLY!")
@@ -0,0 +1,90 @@
+"""
+Query cache and conditional GET tests for the API, with Snowflake stubbed out at execute_query
+"""
+
+import pytest
+
+pytest.importorskip("snowflake.connector")
+pytest.importorskip("httpx")
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from api import main
+
+SEGMENTS_PATH = "/api/customers/segments"
+SEGMENTS = [{"customer_segment": "VIP", "customer_count": 3, "avg_spent": 12000.0, "total_spent": 36000.0}]
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Stub execute_query: LAST_BATCH_SQL returns backend['marker'], everything else SEGMENTS"""
+    state = {"marker": "2011-12-09 12:50:00+rollup", "calls": []}
+
+    async def execute_query(sql, params=(), prepared=False):
+        state["calls"].append(sql)
+        if sql == main.LAST_BATCH_SQL:
+            if state["marker"] is None:
+                raise HTTPException(status_code=500, detail="Database query failed")
+            return [{"last_batch_ts": state["marker"]}]
+        return SEGMENTS
+
+    monkeypatch.setattr(main, "execute_query", execute_query)
+    # Re-read the marker on every request instead of holding it for BATCH_TS_TTL_SECONDS
+    monkeypatch.setattr(main, "BATCH_TS_TTL_SECONDS", 0)
+    monkeypatch.setattr(main, "_last_batch_ts", None)
+    main.invalidate_query_cache()
+    yield state
+    main.invalidate_query_cache()
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+def data_calls(backend):
+    return [sql for sql in backend["calls"] if sql != main.LAST_BATCH_SQL]
+
+def test_ok_response_carries_etag(backend, client):
+    response = client.get(SEGMENTS_PATH)
+
+    assert response.status_code == 200
+    assert response.json() == SEGMENTS
+    assert response.headers["ETag"].startswith('W/"')
+    assert response.headers["Cache-Control"] == main.CACHE_CONTROL
+
+def test_matching_if_none_match_gets_304(backend, client):
+    etag = client.get(SEGMENTS_PATH).headers["ETag"]
+
+    for if_none_match in (etag, f'W/"other", {etag}', "*"):
+        response = client.get(SEGMENTS_PATH, headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+    stale = client.get(SEGMENTS_PATH, headers={"If-None-Match": 'W/"other"'})
+    assert stale.status_code == 200
+
+def test_marker_change_rotates_etag_and_clears_cache(backend, client):
+    first = client.get(SEGMENTS_PATH).headers["ETag"]
+    client.get(SEGMENTS_PATH)
+    assert len(data_calls(backend)) == 1
+
+    backend["marker"] = "2011-12-09 13:05:00"
+    response = client.get(SEGMENTS_PATH, headers={"If-None-Match": first})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != first
+    # The cached segments result was dropped, so the query ran again
+    assert len(data_calls(backend)) == 2
+
+def test_paths_outside_prefixes_get_no_validators(backend, client):
+    response = client.get("/")
+
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert backend["calls"] == []
+
+def test_metadata_unavailable_serves_without_validators(backend, client):
+    backend["marker"] = None
+    response = client.get(SEGMENTS_PATH)
+
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
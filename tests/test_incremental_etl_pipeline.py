@@ -0,0 +1,30 @@
+"""
+Incremental ETL pipeline tests against the checked-in processed CSV
+"""
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("snowflake.connector")
+
+from etl import incremental_etl_pipeline
+from etl.incremental_etl_pipeline import IncrementalETLPipeline
+
+PROCESSED_CSV = Path(__file__).resolve().parent.parent / "data" / "processed" / "online_retail.csv"
+
+def test_read_batch_parses_tracked_csv(monkeypatch):
+    """The first batch of the tracked CSV parses, including CustomerID values like '15012.0'"""
+    monkeypatch.setattr(incremental_etl_pipeline, "CSV_FILE", str(PROCESSED_CSV))
+    pipeline = IncrementalETLPipeline()
+
+    df = pipeline.read_batch(1)
+
+    assert len(df) == pipeline.batch_size
+    assert df['CustomerID'].dtype == pd.Int64Dtype()
+    assert df['CustomerID'].iloc[1] == 15012
+    assert pd.isna(df['CustomerID'].iloc[0])
+
+    # The next sequential batch continues on the same stream
+    assert len(pipeline.read_batch(2)) == pipeline.batch_size